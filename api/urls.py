@@ -2,7 +2,8 @@ from django.urls import path, include
 from user_profile.views import ProfileView
 from places.views import (PlaceSearchView, FoodEstablishmentSearchView, 
      RentalSearchView, CategoryListView, ReviewViewSet, RentalRetrieveUpdateView, 
-     FoodEstablishmentRetrieveUpdateView, RentalFavoriteListView)
+     FoodEstablishmentRetrieveUpdateView, RentalFavoriteListView, NearestPlacesView,
+     PlaceSuggestView, MapIconSpriteIndexView, MapIconSpriteView, PlaceExportView)
 from rest_framework.routers import DefaultRouter
 
 app_name = 'api'
@@ -16,6 +17,11 @@ urlpatterns = [
      path('categories/', CategoryListView.as_view(), name='category-list'),
 
      path('places/search/', PlaceSearchView.as_view(), name='places'),
+     path('places/nearest/', NearestPlacesView.as_view(), name='places-nearest'),
+     path('places/suggest/', PlaceSuggestView.as_view(), name='places-suggest'),
+     path('places/export.<str:export_format>', PlaceExportView.as_view(), name='places-export'),
+     path('places/map-icons/', MapIconSpriteIndexView.as_view(), name='map-icon-index'),
+     path('places/map-icons/<str:sprite_hash>.png', MapIconSpriteView.as_view(), name='map-icon-sprite'),
      path('places/rental/', RentalSearchView.as_view(), name='rental-search'),
      path('places/rental/detail/<int:id>/', RentalRetrieveUpdateView.as_view(), name='rental-detail'),
      path('places/rental/favorites/', RentalFavoriteListView.as_view(), name='rental-favorites'),
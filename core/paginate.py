@@ -1,7 +1,40 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 
 
 class ExtraSmallResultsSetPagination(PageNumberPagination):
     page_size = 10
     page_size_query_param = 'page_size'
-    max_page_size = 100
\ No newline at end of file
+    max_page_size = 100
+
+
+class ExtraSmallCursorPagination(CursorPagination):
+    """
+    Keyset pagination for infinite scroll. Matches Building.Meta.ordering, with `id` as
+    the tie-breaker, and never issues a COUNT(*) or a growing OFFSET.
+    """
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-updated_at', 'id')
+
+
+class CursorPaginationMixin:
+    """
+    Lets a list view switch to cursor pagination with `?pagination=cursor`. Follow-up
+    requests carry the opaque `cursor` token from `next`/`previous`, which keeps the mode.
+    Without either parameter the view's regular pagination_class is used.
+    """
+    cursor_pagination_class = ExtraSmallCursorPagination
+
+    def use_cursor_pagination(self):
+        params = self.request.query_params
+        return params.get('pagination') == 'cursor' or self.cursor_pagination_class.cursor_query_param in params
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            if self.use_cursor_pagination():
+                self._paginator = self.cursor_pagination_class()
+            else:
+                return super().paginator
+        return self._paginator
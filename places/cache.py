@@ -0,0 +1,106 @@
+import functools
+import hashlib
+from urllib.parse import urlencode
+
+from django.core.cache import cache
+from django.conf import settings
+from rest_framework.response import Response
+
+CATEGORY_TREE_VERSION_KEY = 'places:category_tree:version'
+CATALOG_VERSION_KEY = 'places:catalog:version'
+COORDINATE_PARAMS = ('latitude', 'longitude')
+
+
+def get_version(key):
+    """ Current value of a version counter, starting at 1. """
+    cache.add(key, 1, timeout=None)
+    return cache.get(key, 1)
+
+
+def bump_version(key):
+    """ Move a version counter forward so every entry keyed on the old version is ignored. """
+    try:
+        cache.incr(key)
+    except ValueError:
+        # The counter was evicted or never set; any value other than the old one will do
+        cache.set(key, get_version(key) + 1, timeout=None)
+
+
+def get_category_tree():
+    """
+    Return the serialized root categories with their subcategories, as CategoryListView
+    renders them. The tree is serialized once per version and shared through the cache;
+    the Category signals in places.signals bump the version on every change. With the
+    default per-process cache other workers see a change after the timeout at the latest.
+    """
+    from .models import Category
+    from .serializers import CategorySerializer
+
+    key = f'places:category_tree:{get_version(CATEGORY_TREE_VERSION_KEY)}'
+    tree = cache.get(key)
+    if tree is None:
+        roots = Category.objects.filter(parent__isnull=True).prefetch_related('subcategories').order_by('id')
+        tree = [dict(item) for item in CategorySerializer(roots, many=True).data]
+        cache.set(key, tree, timeout=getattr(settings, 'PLACES_CATEGORY_TREE_TIMEOUT', 300))
+    return tree
+
+
+def invalidate_category_tree():
+    bump_version(CATEGORY_TREE_VERSION_KEY)
+
+
+def invalidate_catalog():
+    """ Drop every cached search response, called whenever a place or anything shown with it changes. """
+    bump_version(CATALOG_VERSION_KEY)
+
+
+def snap_coordinate(value, grid):
+    """ Round a coordinate query parameter to the response cache grid, leaving invalid values alone. """
+    try:
+        return f'{round(float(value) / grid) * grid:.6f}'
+    except (TypeError, ValueError):
+        return value
+
+
+def cache_anonymous_response(handler):
+    """
+    Serve repeated anonymous requests to a view's get() handler from the cache.
+
+    Responses are keyed on the path and the sorted query parameters. Latitude and longitude
+    are snapped to a PLACES_RESPONSE_CACHE_GRID degree grid before the view runs, so nearby
+    searches share one entry and the cached results match the coordinates they were computed
+    for. Keys include the catalog version, which the signals in places.signals bump on every
+    change to places, reviews, photos and categories. With the default per-process cache,
+    other workers see a change after PLACES_RESPONSE_CACHE_TIMEOUT seconds at the latest.
+    """
+    @functools.wraps(handler)
+    def get(view, request, *args, **kwargs):
+        timeout = getattr(settings, 'PLACES_RESPONSE_CACHE_TIMEOUT', 60)
+        if not timeout or request.user.is_authenticated:
+            return handler(view, request, *args, **kwargs)
+
+        grid = getattr(settings, 'PLACES_RESPONSE_CACHE_GRID', 0.001)
+        params = request._request.GET.copy()
+        if grid:
+            for param in COORDINATE_PARAMS:
+                if param in params:
+                    params.setlist(param, [snap_coordinate(value, grid) for value in params.getlist(param)])
+            request._request.GET = params
+
+        query = urlencode(sorted((name, value) for name, values in params.lists() for value in values if value != ''))
+        digest = hashlib.sha1(f'{request.get_host()}{request.path}?{query}'.encode()).hexdigest()
+        key = f'places:response:{get_version(CATALOG_VERSION_KEY)}:{digest}'
+
+        data = cache.get(key)
+        if data is not None:
+            response = Response(data)
+            response['X-Cache'] = 'HIT'
+            return response
+
+        response = handler(view, request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, timeout=timeout)
+            response['X-Cache'] = 'MISS'
+        return response
+
+    return get
@@ -0,0 +1,114 @@
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import FoodEstablishment, Rental
+from .renditions import rendition_urls
+from .spatial_index import FOOD, RENTAL
+
+NDJSON = 'ndjson'
+GEOJSON = 'geojson'
+CONTENT_TYPES = {
+    NDJSON: 'application/x-ndjson',
+    GEOJSON: 'application/geo+json',
+}
+MODELS = {
+    RENTAL: Rental,
+    FOOD: FoodEstablishment,
+}
+# Internal bookkeeping, the owner and the icon file (exported as a url instead)
+EXCLUDED_FIELDS = {
+    'building_ptr', 'user_profile', 'is_food_establishment', 'map_icon',
+    'search_vector', 'sentiment_count', 'sentiment_sum',
+}
+
+
+def export_chunk_size():
+    return getattr(settings, 'PLACES_EXPORT_CHUNK_SIZE', 500)
+
+
+def export_fields(model):
+    return [field for field in model._meta.concrete_fields if field.name not in EXCLUDED_FIELDS]
+
+
+def place_record(place, kind, fields, absolute_url=None):
+    """ One place as a plain dict; categories and photos must already be prefetched. """
+    record = {'type': kind}
+    for field in fields:
+        record[field.attname] = field.value_from_object(place)
+    if place.map_icon:
+        record['map_icon'] = absolute_url(place.map_icon.url) if absolute_url else place.map_icon.url
+    else:
+        record['map_icon'] = None
+    record['categories'] = [
+        {'id': category.pk, 'name': category.name, 'parent': category.parent_id}
+        for category in place.categories.all()
+    ]
+    record['photos'] = [
+        {
+            'id': photo.pk,
+            'image': (absolute_url(photo.image.url) if absolute_url else photo.image.url) if photo.image else None,
+            'renditions': rendition_urls(photo, absolute_url) if photo.image else {},
+        }
+        for photo in place.photos.all()
+    ]
+    return record
+
+
+def iter_records(kinds=None, chunk_size=None, absolute_url=None):
+    """
+    Yield every rental and food establishment as a dict, ordered by id within each type.
+
+    Rows are read with a database cursor `chunk_size` at a time and categories and photos
+    are prefetched per chunk, so memory stays flat however large the catalog is.
+    """
+    chunk_size = chunk_size or export_chunk_size()
+    for kind in kinds or (RENTAL, FOOD):
+        model = MODELS[kind]
+        fields = export_fields(model)
+        queryset = model.objects.order_by('pk').prefetch_related('categories', 'photos')
+        for place in queryset.iterator(chunk_size=chunk_size):
+            yield place_record(place, kind, fields, absolute_url)
+
+
+def _dumps(value):
+    return json.dumps(value, cls=DjangoJSONEncoder, separators=(',', ':'))
+
+
+def _feature(record):
+    return {
+        'type': 'Feature',
+        'id': record['id'],
+        'geometry': {'type': 'Point', 'coordinates': [record['longitude'], record['latitude']]},
+        'properties': record,
+    }
+
+
+def iter_export(export_format, kinds=None, chunk_size=None, absolute_url=None):
+    """
+    Yield the export as text pieces of about `chunk_size` places each, ready for a
+    StreamingHttpResponse or a file. NDJSON is one place per line, GeoJSON a single
+    FeatureCollection of Point features.
+    """
+    chunk_size = chunk_size or export_chunk_size()
+    geojson = export_format == GEOJSON
+    if geojson:
+        yield '{"type":"FeatureCollection","features":['
+
+    pieces = []
+    first = True
+    for record in iter_records(kinds, chunk_size, absolute_url):
+        if geojson:
+            pieces.append(_dumps(_feature(record)) if first else ',' + _dumps(_feature(record)))
+            first = False
+        else:
+            pieces.append(_dumps(record) + '\n')
+        if len(pieces) >= chunk_size:
+            yield ''.join(pieces)
+            pieces = []
+
+    if pieces:
+        yield ''.join(pieces)
+    if geojson:
+        yield ']}\n'
@@ -0,0 +1,39 @@
+import base64
+import io
+import os
+
+from django.core.cache import cache
+from PIL import Image
+
+
+def map_icon_cache_key(path):
+    """ Cache key for an icon file; the mtime makes a replaced file get a fresh key. """
+    return f'places:map_icon:{path}:{os.path.getmtime(path)}'
+
+
+def encode_map_icon(map_icon):
+    """
+    Return the map icon as base64-encoded PNG, or None if there is no readable icon.
+    The encoding is done once per file version and then served from the cache.
+    """
+    if not map_icon:
+        return None
+
+    try:
+        path = map_icon.path
+        key = map_icon_cache_key(path)
+    except (NotImplementedError, OSError, ValueError):
+        return None  # No local file behind the field
+
+    bitmap = cache.get(key)
+    if bitmap is None:
+        try:
+            image = Image.open(path)
+
+            byte_arr = io.BytesIO()
+            image.save(byte_arr, format='PNG')  # Save as PNG instead of BMP
+            bitmap = base64.b64encode(byte_arr.getvalue()).decode('utf-8')
+        except (FileNotFoundError, OSError):
+            return None
+        cache.set(key, bitmap, timeout=None)
+    return bitmap
@@ -0,0 +1,54 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from places.utils import DistanceMixin
+
+
+class Command(BaseCommand, DistanceMixin):
+    help = 'Micro-benchmark the scalar haversine loop against the vectorized NumPy path.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000],
+                            help='Number of points to benchmark')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per size, the best is reported')
+        parser.add_argument('--radius', type=float, default=10, help='Radius in km for the mask')
+
+    def best_of(self, repeat, func):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+        return min(timings)
+
+    def handle(self, *args, **options):
+        origin_lat, origin_lon = 14.5231427, 121.0164655
+        radius = options['radius']
+        repeat = options['repeat']
+        rng = random.Random(42)
+
+        self.stdout.write(f'{"points":>10} {"scalar (ms)":>14} {"numpy (ms)":>14} {"speedup":>10}')
+        for size in options['sizes']:
+            lats = [origin_lat + rng.uniform(-0.5, 0.5) for _ in range(size)]
+            lons = [origin_lon + rng.uniform(-0.5, 0.5) for _ in range(size)]
+
+            def scalar():
+                return [
+                    self.haversine(origin_lon, origin_lat, lon, lat) <= radius
+                    for lat, lon in zip(lats, lons)
+                ]
+
+            def vectorized():
+                return self.haversine_many(origin_lon, origin_lat, lons, lats, radius)[1]
+
+            # Both paths have to agree before their timings mean anything
+            if scalar() != vectorized().tolist():
+                self.stderr.write(f'Scalar and vectorized masks differ at {size} points')
+
+            scalar_time = self.best_of(repeat, scalar)
+            vector_time = self.best_of(repeat, vectorized)
+            self.stdout.write(
+                f'{size:>10} {scalar_time * 1000:>14.3f} {vector_time * 1000:>14.3f} {scalar_time / vector_time:>9.1f}x'
+            )
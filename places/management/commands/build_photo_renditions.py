@@ -0,0 +1,47 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from places.models import BuildingPhoto
+from places.renditions import render_photo
+
+
+class Command(BaseCommand):
+    help = 'Generate thumbnail, detail and WebP renditions for building photos that are missing them.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Photos resized in parallel.')
+        parser.add_argument('--force', action='store_true', help='Regenerate renditions that are already up to date.')
+
+    def handle(self, *args, **options):
+        force = options['force']
+
+        def render(pk):
+            try:
+                return render_photo(pk, force=force), None
+            except Exception as exc:
+                return False, f'Photo {pk}: {exc}'
+            finally:
+                close_old_connections()
+
+        pks = BuildingPhoto.objects.exclude(image='').order_by('pk').values_list('pk', flat=True)
+        start = time.perf_counter()
+        rendered = skipped = failed = 0
+        # Pillow releases the GIL while decoding, resizing and encoding, so threads scale here
+        with ThreadPoolExecutor(max_workers=max(options['workers'], 1)) as executor:
+            for done, error in executor.map(render, pks.iterator()):
+                if error:
+                    failed += 1
+                    self.stderr.write(error)
+                elif done:
+                    rendered += 1
+                else:
+                    skipped += 1
+        elapsed = time.perf_counter() - start
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Rendered {rendered} photos ({skipped} up to date, {failed} failed) in {elapsed:.2f}s '
+            f'({rendered / elapsed if elapsed else 0:.1f} photos/s)'
+        ))
@@ -0,0 +1,46 @@
+import time
+from urllib.parse import urljoin
+
+from django.core.management.base import BaseCommand
+
+from places.export import GEOJSON, NDJSON, export_chunk_size, iter_export
+
+
+class Command(BaseCommand):
+    help = (
+        'Export every rental and food establishment as NDJSON or a GeoJSON FeatureCollection, '
+        'the same output as places/export.ndjson|geojson. Rows are streamed, so memory use does '
+        'not grow with the catalog.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=[NDJSON, GEOJSON], default=NDJSON)
+        parser.add_argument('--type', choices=['rental', 'food'], help='Only export this type.')
+        parser.add_argument('--output', '-o', help='File to write (default: stdout).')
+        parser.add_argument('--chunk-size', type=int, default=export_chunk_size(), help='Places read per database round trip.')
+        parser.add_argument('--base-url', help='Make media urls absolute, e.g. https://example.com/')
+
+    def handle(self, *args, **options):
+        base_url = options['base_url']
+        absolute_url = (lambda url: urljoin(base_url, url)) if base_url else None
+        kinds = [options['type']] if options['type'] else None
+
+        start = time.perf_counter()
+        written = 0
+        output = open(options['output'], 'w', encoding='utf-8') if options['output'] else None
+        try:
+            for piece in iter_export(options['format'], kinds, max(options['chunk_size'], 1), absolute_url):
+                if output:
+                    output.write(piece)
+                else:
+                    self.stdout.write(piece, ending='')
+                written += len(piece)
+        finally:
+            if output:
+                output.close()
+        elapsed = time.perf_counter() - start
+
+        # stdout may be the export itself, so the summary goes to stderr
+        self.stderr.write(self.style.SUCCESS(
+            f'Exported {written / 1024:.0f} KiB in {elapsed:.2f}s ({written / 1024 / elapsed if elapsed else 0:.0f} KiB/s)'
+        ))
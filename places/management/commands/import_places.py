@@ -0,0 +1,211 @@
+import csv
+import json
+import time
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import BooleanField
+
+from places.cache import invalidate_catalog
+from places.models import Building, Category, FoodEstablishment, Rental
+from user_profile.models import UserProfile
+
+MODELS = {
+    'rental': Rental,
+    'food': FoodEstablishment,
+    'foodestablishment': FoodEstablishment,
+}
+TRUE_VALUES = {'1', 'true', 't', 'yes', 'y'}
+# Set by the command or the database, never read from the file
+SKIPPED_FIELDS = {'id', 'building_ptr', 'user_profile', 'categories', 'map_icon', 'is_food_establishment'}
+
+
+class Command(BaseCommand):
+    help = (
+        'Import rentals and food establishments from a CSV or NDJSON file. Columns are model field names, '
+        'plus `type` (rental or food, unless --type is given) and `categories` (a list in NDJSON, '
+        'separated by ";" in CSV). A category is given by name or as "Parent/Child" when the name is ambiguous. '
+        'Invalid rows are reported and skipped, the rest is written in chunks.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or NDJSON file to import.')
+        parser.add_argument('--owner', required=True, help='Username of the user the imported places belong to.')
+        parser.add_argument('--type', choices=['rental', 'food'], help='Import every row as this type.')
+        parser.add_argument('--format', choices=['csv', 'ndjson'], help='File format (default: from the extension).')
+        parser.add_argument('--chunk-size', type=int, default=500, help='Places written per transaction.')
+        parser.add_argument('--dry-run', action='store_true', help='Validate the rows without writing anything.')
+
+    def handle(self, *args, **options):
+        try:
+            owner = UserProfile.objects.get(user__username=options['owner'])
+        except UserProfile.DoesNotExist:
+            raise CommandError(f'No user profile for {options["owner"]!r}')
+
+        file_format = options['format'] or ('csv' if options['path'].lower().endswith('.csv') else 'ndjson')
+        chunk_size = max(options['chunk_size'], 1)
+        self.category_map = self.load_categories()
+        self.names = set(Building.objects.values_list('name', flat=True))
+        self.unknown_columns = set()
+
+        start = time.perf_counter()
+        read = imported = failed = 0
+        pending = {Rental: [], FoodEstablishment: []}
+        for line, row in self.read_rows(options['path'], file_format):
+            read += 1
+            try:
+                place, category_ids = self.build(row, owner, options['type'])
+            except (ValidationError, ValueError, TypeError) as error:
+                failed += 1
+                messages = error.messages if isinstance(error, ValidationError) else [str(error)]
+                self.stderr.write(f'Line {line}: {"; ".join(messages)}')
+                continue
+
+            self.names.add(place.name)
+            batch = pending[type(place)]
+            batch.append((place, category_ids))
+            if len(batch) >= chunk_size:
+                imported += self.flush(type(place), batch, options['dry_run'])
+                batch.clear()
+
+        for model, batch in pending.items():
+            if batch:
+                imported += self.flush(model, batch, options['dry_run'])
+        elapsed = time.perf_counter() - start
+
+        if imported and not options['dry_run']:
+            # bulk inserts skip the model signals that drop cached search responses
+            invalidate_catalog()
+        if self.unknown_columns:
+            self.stderr.write(f'Ignored unknown columns: {", ".join(sorted(self.unknown_columns))}')
+        verb = 'Validated' if options['dry_run'] else 'Imported'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {imported} of {read} rows ({failed} failed) in {elapsed:.2f}s '
+            f'({read / elapsed if elapsed else 0:.0f} rows/s)'
+        ))
+
+    def load_categories(self):
+        """ Map casefolded 'name' and 'parent/name' to category ids; ambiguous names map to None. """
+        category_map = {}
+        for pk, name, parent_name in Category.objects.values_list('id', 'name', 'parent__name'):
+            keys = [name.casefold()]
+            if parent_name:
+                keys.append(f'{parent_name}/{name}'.casefold())
+            for key in keys:
+                category_map[key] = None if key in category_map else pk
+        return category_map
+
+    def read_rows(self, path, file_format):
+        """ Yield (line number, row dict) one row at a time. """
+        with open(path, newline='', encoding='utf-8') as source:
+            if file_format == 'csv':
+                reader = csv.DictReader(source)
+                for row in reader:
+                    yield reader.line_num, row
+                return
+
+            for line, text in enumerate(source, start=1):
+                if not text.strip():
+                    continue
+                try:
+                    row = json.loads(text)
+                except ValueError as error:
+                    row = error  # Reported as a failed row by build()
+                yield line, row
+
+    def build(self, row, owner, place_type):
+        """ Turn one row into an unsaved, validated Rental/FoodEstablishment and its category ids. """
+        if isinstance(row, Exception):
+            raise ValueError(f'Invalid JSON: {row}')
+        if not isinstance(row, dict):
+            raise ValueError('Each line must be a JSON object')
+
+        row = dict(row)
+        kind = place_type or str(row.pop('type', '') or '').lower()
+        row.pop('type', None)
+        model = MODELS.get(kind)
+        if model is None:
+            raise ValueError(f'Unknown place type {kind!r}, expected rental or food')
+
+        categories = row.pop('categories', None) or []
+        if isinstance(categories, str):
+            categories = [name for name in categories.split(';') if name.strip()]
+        category_ids = []
+        for name in categories:
+            key = str(name).strip().casefold()
+            if key not in self.category_map:
+                raise ValueError(f'Unknown category {name!r}')
+            if self.category_map[key] is None:
+                raise ValueError(f'Category {name!r} is ambiguous, use "Parent/{name}"')
+            category_ids.append(self.category_map[key])
+
+        values = {}
+        for column, value in row.items():
+            if value is None or value == '':
+                continue  # Leave it to the field default; also lets one CSV mix both types
+            try:
+                field = model._meta.get_field(column)
+            except FieldDoesNotExist:
+                field = None
+            if field is None or column in SKIPPED_FIELDS or not field.editable or not field.concrete:
+                self.unknown_columns.add(column)
+                continue
+            if isinstance(field, BooleanField) and isinstance(value, str):
+                value = value.strip().lower() in TRUE_VALUES
+            try:
+                values[field.attname] = field.to_python(value)
+            except ValidationError as error:
+                raise ValidationError(f'{column}: {"; ".join(error.messages)}')
+
+        place = model(user_profile=owner, is_food_establishment=model is FoodEstablishment, **values)
+        # Same checks as saving through the admin; uniqueness is checked against the preloaded names
+        try:
+            place.clean_fields(exclude=SKIPPED_FIELDS)
+        except ValidationError as error:
+            raise ValidationError([f'{name}: {"; ".join(messages)}' for name, messages in error.message_dict.items()])
+        place.clean()
+        if place.name in self.names:
+            raise ValidationError(f'A place named {place.name!r} already exists')
+        return place, category_ids
+
+    def flush(self, model, batch, dry_run):
+        """ Write one chunk: the Building rows, the subclass rows and the category links. """
+        if dry_run:
+            return len(batch)
+
+        places = [place for place, _ in batch]
+        with transaction.atomic():
+            # bulk_create can't insert multi-table inherited models, so the parent rows are
+            # bulk created first and the subclass rows inserted under the returned ids
+            parents = [
+                Building(**{field.attname: getattr(place, field.attname) for field in Building._meta.concrete_fields if not field.primary_key})
+                for place in places
+            ]
+            Building.objects.bulk_create(parents)
+            if any(parent.pk is None for parent in parents):
+                raise CommandError('This database does not return ids from bulk inserts')
+            for place, parent in zip(places, parents):
+                place.pk = place.building_ptr_id = parent.pk
+                place.created_at, place.updated_at = parent.created_at, parent.updated_at
+
+            fields = model._meta.local_concrete_fields
+            quote = connection.ops.quote_name
+            sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+                quote(model._meta.db_table),
+                ', '.join(quote(field.column) for field in fields),
+                ', '.join(['%s'] * len(fields)),
+            )
+            with connection.cursor() as cursor:
+                cursor.executemany(sql, [
+                    [field.get_db_prep_save(getattr(place, field.attname), connection) for field in fields]
+                    for place in places
+                ])
+
+            through = Building.categories.through
+            through.objects.bulk_create([
+                through(building_id=place.pk, category_id=category_id)
+                for place, category_ids in batch
+                for category_id in dict.fromkeys(category_ids)
+            ])
+        return len(batch)
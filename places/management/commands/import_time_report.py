@@ -0,0 +1,72 @@
+import os
+import re
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+IMPORT_TIME_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)')
+
+
+class Command(BaseCommand):
+    help = (
+        'Report module import times of a fresh interpreter running django.setup() '
+        '(python -X importtime), to catch startup regressions.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--module', action='append', dest='modules',
+            help='Also import this module after django.setup(), can be repeated (default: vill_finder_core.wsgi, api.urls).',
+        )
+        parser.add_argument('--top', type=int, default=20, help='Number of slowest modules to list.')
+        parser.add_argument('--sort', choices=['cumulative', 'self'], default='cumulative')
+        parser.add_argument('--fail-over', type=float, help='Exit with an error if the total import time exceeds this many ms.')
+
+    def handle(self, *args, **options):
+        modules = options['modules'] or ['vill_finder_core.wsgi', 'api.urls']
+        script = 'import django; django.setup()\n' + ''.join(f'import {module}\n' for module in modules)
+
+        env = os.environ.copy()
+        env.setdefault('DJANGO_SETTINGS_MODULE', 'vill_finder_core.settings')
+        # The project has to be importable however the command was started, e.g. from another directory
+        base_dir = str(settings.BASE_DIR)
+        env['PYTHONPATH'] = os.pathsep.join(filter(None, [base_dir, env.get('PYTHONPATH')]))
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', script],
+            env=env, capture_output=True, text=True, cwd=base_dir,
+        )
+        if result.returncode:
+            raise CommandError(f'Import failed:\n{result.stderr[-2000:]}')
+
+        rows = []
+        for line in result.stderr.splitlines():
+            match = IMPORT_TIME_LINE.match(line)
+            if match:
+                self_us, cumulative_us, indent, name = match.groups()
+                rows.append((name, int(self_us), int(cumulative_us), len(indent) // 2))
+
+        total_ms = sum(row[1] for row in rows) / 1000
+        column = 2 if options['sort'] == 'cumulative' else 1
+        self.stdout.write(f'{"cumulative ms":>14} {"self ms":>9}  module')
+        for name, self_us, cumulative_us, _ in sorted(rows, key=lambda row: row[column], reverse=True)[:options['top']]:
+            self.stdout.write(f'{cumulative_us / 1000:14.1f} {self_us / 1000:9.1f}  {name}')
+
+        # Top-level third party packages, the usual suspects for slow startup
+        packages = {}
+        for name, _, cumulative_us, depth in rows:
+            if depth == 0:
+                package = name.split('.')[0]
+                packages[package] = packages.get(package, 0) + cumulative_us
+        slowest = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:10]
+        self.stdout.write('\nBy top-level package: ' + ', '.join(f'{name} {us / 1000:.1f}ms' for name, us in slowest))
+
+        loaded = {row[0].split('.')[0] for row in rows}
+        for package in ('nltk', 'textblob'):
+            if package in loaded:
+                self.stdout.write(self.style.WARNING(f'{package} is imported at startup'))
+
+        self.stdout.write(self.style.SUCCESS(f'{len(rows)} modules imported in {total_ms:.1f}ms'))
+        if options['fail_over'] is not None and total_ms > options['fail_over']:
+            raise CommandError(f'Import time {total_ms:.1f}ms is over the {options["fail_over"]:.1f}ms budget')
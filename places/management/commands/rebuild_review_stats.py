@@ -0,0 +1,48 @@
+import time
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from places.cache import invalidate_catalog
+from places.models import Building, FoodEstablishment, Rental, Review, sentiment_label_for
+
+
+def compute_review_stats(building_model, review_model, content_type_ids):
+    """ Recompute every building's review statistics from the review table. """
+    rows = (
+        review_model.objects.filter(content_type_id__in=content_type_ids)
+        .order_by()
+        .values('object_id')
+        .annotate(total=Count('id'), scored=Count('sentiment_score'), score_sum=Sum('sentiment_score'))
+    )
+    stats = {row['object_id']: row for row in rows}
+
+    buildings = []
+    for building in building_model.objects.only('id').order_by('id').iterator(chunk_size=1000):
+        row = stats.get(building.pk, {'total': 0, 'scored': 0, 'score_sum': None})
+        building.review_count = row['total']
+        building.sentiment_count = row['scored']
+        building.sentiment_sum = row['score_sum'] or 0.0
+        building.avg_sentiment = building.sentiment_sum / row['scored'] if row['scored'] else None
+        building.sentiment_label = sentiment_label_for(building.review_count, building.avg_sentiment)
+        buildings.append(building)
+
+    fields = ['review_count', 'sentiment_count', 'sentiment_sum', 'avg_sentiment', 'sentiment_label']
+    building_model.objects.bulk_update(buildings, fields, batch_size=500)
+    return len(buildings)
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the stored review count and sentiment statistics of every place from the reviews.'
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        content_type_ids = [content_type.id for content_type in ContentType.objects.get_for_models(Rental, FoodEstablishment).values()]
+        with transaction.atomic():
+            updated = compute_review_stats(Building, Review, content_type_ids)
+        invalidate_catalog()
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt review stats for {updated} places in {time.perf_counter() - start:.2f}s'
+        ))
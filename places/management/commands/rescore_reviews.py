@@ -0,0 +1,98 @@
+import multiprocessing
+import os
+import time
+from collections import deque
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+
+from places.cache import invalidate_catalog
+from places.models import Building, FoodEstablishment, Rental, Review
+from places.management.commands.rebuild_review_stats import compute_review_stats
+from places.sentiment import get_analyzer, score_text
+
+
+def init_worker():
+    # Workers only score text, they must never reuse a database connection inherited from the parent
+    connections.close_all()
+    # Load the lexicon once per worker rather than on its first batch
+    get_analyzer()
+
+
+def score_batch(batch):
+    """ Score a list of (pk, comment, old score) rows, keeping only the changed ones. """
+    results = []
+    for pk, comment, old_score in batch:
+        label, score = score_text(comment)
+        if score != old_score:
+            results.append((pk, label, score))
+    return len(batch), results
+
+
+class Command(BaseCommand):
+    help = 'Recompute the sentiment of every review comment in parallel and refresh the review stats of places.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Scoring processes.')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Reviews per batch sent to a worker and per bulk_update.')
+        parser.add_argument('--missing-only', action='store_true', help='Only score reviews without a sentiment score, such as ones left pending by a restart.')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        reviews = Review.objects.exclude(comment__isnull=True).exclude(comment='')
+        if options['missing_only']:
+            reviews = reviews.filter(sentiment_score__isnull=True)
+        rows = reviews.order_by('pk').values_list('pk', 'comment', 'sentiment_score').iterator(chunk_size=chunk_size)
+
+        def batches():
+            batch = []
+            for row in rows:
+                batch.append(row)
+                if len(batch) == chunk_size:
+                    yield batch
+                    batch = []
+            if batch:
+                yield batch
+
+        def save(count, results):
+            if results:
+                Review.objects.bulk_update(
+                    [Review(pk=pk, sentiment_label=label, sentiment_score=score) for pk, label, score in results],
+                    ['sentiment_label', 'sentiment_score'],
+                    batch_size=chunk_size,
+                )
+            return count, len(results)
+
+        start = time.perf_counter()
+        scored = changed = 0
+        workers = max(options['workers'], 1)
+        # Forked workers inherit open connections, so fork without any
+        connections.close_all()
+        with multiprocessing.Pool(workers, initializer=init_worker) as pool:
+            # Batches are read here, on the main thread's connection, and at most two per
+            # worker are in flight so the reviews are never all held in memory at once
+            pending = deque()
+            for batch in batches():
+                pending.append(pool.apply_async(score_batch, (batch,)))
+                if len(pending) >= 2 * workers:
+                    count, saved = save(*pending.popleft().get())
+                    scored += count
+                    changed += saved
+            while pending:
+                count, saved = save(*pending.popleft().get())
+                scored += count
+                changed += saved
+        elapsed = time.perf_counter() - start
+
+        if changed:
+            # bulk_update skips the signals that keep the stored place stats in sync
+            content_type_ids = [content_type.id for content_type in ContentType.objects.get_for_models(Rental, FoodEstablishment).values()]
+            with transaction.atomic():
+                compute_review_stats(Building, Review, content_type_ids)
+            invalidate_catalog()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Scored {scored} reviews ({changed} changed) in {elapsed:.2f}s '
+            f'({scored / elapsed if elapsed else 0:.1f} reviews/s)'
+        ))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from places.spatial_index import spatial_index
+
+
+class Command(BaseCommand):
+    help = 'Build the in-memory spatial index of places and report its size, rebuild time and memory cost.'
+
+    def handle(self, *args, **options):
+        spatial_index.rebuild()
+        for key, value in spatial_index.stats().items():
+            self.stdout.write(f'{key}: {value}')
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.15 on 2026-10-18 06:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('places', '0023_remove_review_stars'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='building',
+            index=models.Index(fields=['latitude', 'longitude'], name='places_buil_latitud_47afa7_idx'),
+        ),
+    ]
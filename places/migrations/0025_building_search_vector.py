@@ -0,0 +1,115 @@
+# Generated by Django 4.2.15 on 2026-10-18 06:58
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+POSTGRES_FORWARDS = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS places_building_search_vector_idx ON places_building USING GIN (search_vector)",
+    "CREATE INDEX IF NOT EXISTS places_building_name_trgm_idx ON places_building USING GIN (name gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS places_building_address_trgm_idx ON places_building USING GIN (address gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS places_category_name_trgm_idx ON places_category USING GIN (name gin_trgm_ops)",
+    """
+    CREATE OR REPLACE FUNCTION places_building_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('simple', coalesce(NEW.name, '')), 'A') ||
+            setweight(to_tsvector('simple', coalesce(NEW.address, '')), 'B') ||
+            setweight(to_tsvector('simple', coalesce(NEW.description, '')), 'C');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER places_building_search_vector_trigger
+        BEFORE INSERT OR UPDATE OF name, address, description ON places_building
+        FOR EACH ROW EXECUTE FUNCTION places_building_search_vector_update()
+    """,
+    # Backfill existing rows through the trigger
+    "UPDATE places_building SET name = name",
+]
+
+POSTGRES_BACKWARDS = [
+    "DROP TRIGGER IF EXISTS places_building_search_vector_trigger ON places_building",
+    "DROP FUNCTION IF EXISTS places_building_search_vector_update()",
+    "DROP INDEX IF EXISTS places_category_name_trgm_idx",
+    "DROP INDEX IF EXISTS places_building_address_trgm_idx",
+    "DROP INDEX IF EXISTS places_building_name_trgm_idx",
+    "DROP INDEX IF EXISTS places_building_search_vector_idx",
+]
+
+
+def sqlite_fts_statements(table, base_table, columns):
+    column_list = ', '.join(columns)
+    new_values = ', '.join(f'new.{column}' for column in columns)
+    old_values = ', '.join(f'old.{column}' for column in columns)
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5({column_list}, content='{base_table}', content_rowid='id')",
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {table}_ai AFTER INSERT ON {base_table} BEGIN
+            INSERT INTO {table}(rowid, {column_list}) VALUES (new.id, {new_values});
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {table}_ad AFTER DELETE ON {base_table} BEGIN
+            INSERT INTO {table}({table}, rowid, {column_list}) VALUES ('delete', old.id, {old_values});
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {table}_au AFTER UPDATE ON {base_table} BEGIN
+            INSERT INTO {table}({table}, rowid, {column_list}) VALUES ('delete', old.id, {old_values});
+            INSERT INTO {table}(rowid, {column_list}) VALUES (new.id, {new_values});
+        END
+        """,
+        f"INSERT INTO {table}({table}) VALUES ('rebuild')",
+    ]
+
+
+SQLITE_FTS = [
+    ('places_building_fts', 'places_building', ['name', 'address', 'description']),
+    ('places_category_fts', 'places_category', ['name']),
+]
+
+
+def create_search_backend(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        for statement in POSTGRES_FORWARDS:
+            schema_editor.execute(statement)
+    elif connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+            if not cursor.fetchone()[0]:
+                return  # No FTS5 in this SQLite build, places.search falls back to icontains
+        for table, base_table, columns in SQLITE_FTS:
+            for statement in sqlite_fts_statements(table, base_table, columns):
+                schema_editor.execute(statement)
+
+
+def drop_search_backend(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        for statement in POSTGRES_BACKWARDS:
+            schema_editor.execute(statement)
+    elif connection.vendor == 'sqlite':
+        for table, base_table, columns in SQLITE_FTS:
+            for suffix in ('ai', 'ad', 'au'):
+                schema_editor.execute(f"DROP TRIGGER IF EXISTS {table}_{suffix}")
+            schema_editor.execute(f"DROP TABLE IF EXISTS {table}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('places', '0024_building_latitude_longitude_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='building',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_backend, drop_search_backend),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.15 on 2026-10-18 07:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_closure(apps, schema_editor):
+    Category = apps.get_model('places', 'Category')
+    CategoryClosure = apps.get_model('places', 'CategoryClosure')
+
+    parents = dict(Category.objects.values_list('id', 'parent_id'))
+    links = []
+    for category_id in parents:
+        # Walk up the parent chain, guarding against cycles in existing data
+        ancestor_id, depth, seen = category_id, 0, set()
+        while ancestor_id is not None and ancestor_id not in seen:
+            seen.add(ancestor_id)
+            links.append(CategoryClosure(ancestor_id=ancestor_id, descendant_id=category_id, depth=depth))
+            ancestor_id, depth = parents.get(ancestor_id), depth + 1
+    CategoryClosure.objects.bulk_create(links, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('places', '0025_building_search_vector'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryClosure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveIntegerField()),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='descendant_links', to='places.category')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_links', to='places.category')),
+            ],
+            options={
+                'unique_together': {('ancestor', 'descendant')},
+            },
+        ),
+        migrations.RunPython(backfill_closure, migrations.RunPython.noop),
+    ]
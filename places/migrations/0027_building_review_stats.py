@@ -0,0 +1,84 @@
+# Generated by Django 4.2.15 on 2026-10-18 07:02
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def sentiment_label_for(review_count, average_sentiment_score):
+    # Frozen copy of places.models.sentiment_label_for, migrations must not import live code
+    if not review_count:
+        return 'No reviews found'
+    if average_sentiment_score is None:
+        return ''
+    if average_sentiment_score > 0.05:
+        return 'positive'
+    if average_sentiment_score < -0.05:
+        return 'negative'
+    return 'neutral'
+
+
+def backfill_review_stats(apps, schema_editor):
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    Building = apps.get_model('places', 'Building')
+    Review = apps.get_model('places', 'Review')
+    content_type_ids = ContentType.objects.filter(
+        app_label='places', model__in=['rental', 'foodestablishment']
+    ).values_list('id', flat=True)
+
+    rows = (
+        Review.objects.filter(content_type_id__in=list(content_type_ids))
+        .order_by()
+        .values('object_id')
+        .annotate(total=Count('id'), scored=Count('sentiment_score'), score_sum=Sum('sentiment_score'))
+    )
+    stats = {row['object_id']: row for row in rows}
+
+    buildings = []
+    for building in Building.objects.only('id').order_by('id').iterator(chunk_size=1000):
+        row = stats.get(building.pk, {'total': 0, 'scored': 0, 'score_sum': None})
+        building.review_count = row['total']
+        building.sentiment_count = row['scored']
+        building.sentiment_sum = row['score_sum'] or 0.0
+        building.avg_sentiment = building.sentiment_sum / row['scored'] if row['scored'] else None
+        building.sentiment_label = sentiment_label_for(building.review_count, building.avg_sentiment)
+        buildings.append(building)
+
+    fields = ['review_count', 'sentiment_count', 'sentiment_sum', 'avg_sentiment', 'sentiment_label']
+    Building.objects.bulk_update(buildings, fields, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('places', '0026_categoryclosure'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='building',
+            name='avg_sentiment',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='building',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='building',
+            name='sentiment_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='building',
+            name='sentiment_label',
+            field=models.CharField(default='No reviews found', editable=False, max_length=20),
+        ),
+        migrations.AddField(
+            model_name='building',
+            name='sentiment_sum',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_review_stats, migrations.RunPython.noop),
+    ]
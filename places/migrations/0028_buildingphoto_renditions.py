@@ -0,0 +1,18 @@
+# Generated by Django 4.2.15 on 2026-10-18 07:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('places', '0027_building_review_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='buildingphoto',
+            name='renditions',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
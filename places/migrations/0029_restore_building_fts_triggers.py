@@ -0,0 +1,29 @@
+import importlib
+
+from django.db import migrations
+
+search_backend = importlib.import_module('places.migrations.0025_building_search_vector')
+
+
+def restore_building_fts_triggers(apps, schema_editor):
+    # SQLite rebuilds places_building to add columns with defaults (0027), which drops the
+    # FTS5 sync triggers created in 0025. Recreate them and reindex what they missed.
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+    if 'places_building_fts' not in connection.introspection.table_names():
+        return  # No FTS5 in this SQLite build
+    for table, base_table, columns in search_backend.SQLITE_FTS:
+        for statement in search_backend.sqlite_fts_statements(table, base_table, columns):
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('places', '0028_buildingphoto_renditions'),
+    ]
+
+    operations = [
+        migrations.RunPython(restore_building_fts_triggers, migrations.RunPython.noop),
+    ]
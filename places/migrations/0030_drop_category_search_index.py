@@ -0,0 +1,58 @@
+from django.db import migrations
+
+
+def drop_category_search(apps, schema_editor):
+    # CategoryListView filters its cached tree in memory, nothing queries these any more
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        schema_editor.execute("DROP INDEX IF EXISTS places_category_name_trgm_idx")
+    elif connection.vendor == 'sqlite':
+        for suffix in ('ai', 'ad', 'au'):
+            schema_editor.execute(f"DROP TRIGGER IF EXISTS places_category_fts_{suffix}")
+        schema_editor.execute("DROP TABLE IF EXISTS places_category_fts")
+
+
+def create_category_search(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        schema_editor.execute(
+            "CREATE INDEX IF NOT EXISTS places_category_name_trgm_idx ON places_category USING GIN (name gin_trgm_ops)"
+        )
+    elif connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+            if not cursor.fetchone()[0]:
+                return
+        statements = [
+            "CREATE VIRTUAL TABLE IF NOT EXISTS places_category_fts USING fts5(name, content='places_category', content_rowid='id')",
+            """
+            CREATE TRIGGER IF NOT EXISTS places_category_fts_ai AFTER INSERT ON places_category BEGIN
+                INSERT INTO places_category_fts(rowid, name) VALUES (new.id, new.name);
+            END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS places_category_fts_ad AFTER DELETE ON places_category BEGIN
+                INSERT INTO places_category_fts(places_category_fts, rowid, name) VALUES ('delete', old.id, old.name);
+            END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS places_category_fts_au AFTER UPDATE ON places_category BEGIN
+                INSERT INTO places_category_fts(places_category_fts, rowid, name) VALUES ('delete', old.id, old.name);
+                INSERT INTO places_category_fts(rowid, name) VALUES (new.id, new.name);
+            END
+            """,
+            "INSERT INTO places_category_fts(places_category_fts) VALUES ('rebuild')",
+        ]
+        for statement in statements:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('places', '0029_restore_building_fts_triggers'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_category_search, create_category_search),
+    ]
@@ -1,12 +1,36 @@
 from django.db import models
+from django.db.models import Case, ExpressionWrapper, F, Value, When
+from django.db.models.functions import NullIf
+from django.db.models.lookups import Exact, GreaterThan, IsNull, LessThan
+from django.contrib.postgres.search import SearchVectorField
 from django.core.exceptions import ValidationError
 from core.base_models import BaseModel
 from django_admin_geomap import GeoItem
 from user_profile.models import UserProfile
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes.fields import GenericForeignKey
-from nltk.sentiment.vader import SentimentIntensityAnalyzer
-from textblob import TextBlob
+from django.conf import settings
+from .sentiment import SENTIMENT_PENDING, score_text
+
+NO_REVIEWS_LABEL = 'No reviews found'
+
+
+def sentiment_label_for(review_count, average_sentiment_score):
+    """ Turn a place's review count and average sentiment score into its label. """
+    if not review_count:
+        return NO_REVIEWS_LABEL
+
+    # Determine the final sentiment label
+    if average_sentiment_score is not None:
+        if average_sentiment_score > 0.05:
+            return "positive"
+        elif average_sentiment_score < -0.05:
+            return "negative"
+        else:
+            return "neutral"
+
+    return ""
+
 
 class Category(BaseModel):
     name = models.CharField(max_length=255)
@@ -22,7 +46,75 @@ class Category(BaseModel):
     @property
     def is_subcategory(self):
         return self.parent is not None
-    
+
+    def clean(self):
+        super().clean()
+
+        # A category can't be moved under itself or anything in its own subtree
+        if self.pk is not None and self.parent_id is not None:
+            if CategoryClosure.objects.filter(ancestor_id=self.pk, descendant_id=self.parent_id).exists():
+                raise ValidationError({'parent': "A category cannot be its own parent or be moved under one of its subcategories."})
+
+    def save(self, *args, **kwargs):
+        self.clean()  # The closure table can't represent a cycle
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def ancestor_ids(cls, category_id):
+        """ The category and all of its ancestors, in one query. """
+        return set(CategoryClosure.objects.filter(descendant_id=category_id).values_list('ancestor_id', flat=True))
+
+    @classmethod
+    def hierarchy_ids(cls, category_ids):
+        """
+        Every category in the trees the given categories belong to, i.e. everything under
+        their root categories, in one query.
+        """
+        roots = CategoryClosure.objects.filter(
+            descendant_id__in=category_ids, ancestor__parent__isnull=True,
+        ).values('ancestor_id')
+        return set(CategoryClosure.objects.filter(ancestor_id__in=roots).values_list('descendant_id', flat=True))
+
+
+class CategoryClosure(models.Model):
+    """
+    Closure table of the Category tree: one row for every (ancestor, descendant) pair,
+    including each category paired with itself at depth 0. Kept in sync by the Category
+    post_save signal in places.signals; rows go away with the category through CASCADE.
+    """
+    ancestor = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='descendant_links')
+    descendant = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='ancestor_links')
+    depth = models.PositiveIntegerField()
+
+    class Meta:
+        unique_together = ('ancestor', 'descendant')
+
+    def __str__(self):
+        return f'{self.ancestor_id} -> {self.descendant_id} ({self.depth})'
+
+    @classmethod
+    def link(cls, category):
+        """
+        Attach a new or moved category, with its whole subtree, under its current parent.
+        """
+        current_parent = cls.objects.filter(descendant=category, depth=1).values_list('ancestor_id', flat=True).first()
+        if current_parent == category.parent_id and cls.objects.filter(ancestor=category, descendant=category).exists():
+            return  # Already linked under this parent
+
+        cls.objects.get_or_create(ancestor=category, descendant=category, defaults={'depth': 0})
+        subtree = list(cls.objects.filter(ancestor=category).values_list('descendant_id', 'depth'))
+        subtree_ids = [pk for pk, _ in subtree]
+
+        # Cut the subtree loose from its old ancestors, then hang it under the new ones
+        cls.objects.filter(descendant_id__in=subtree_ids).exclude(ancestor_id__in=subtree_ids).delete()
+        if category.parent_id is not None:
+            ancestors = cls.objects.filter(descendant_id=category.parent_id).values_list('ancestor_id', 'depth')
+            cls.objects.bulk_create([
+                cls(ancestor_id=ancestor_id, descendant_id=descendant_id, depth=ancestor_depth + 1 + descendant_depth)
+                for ancestor_id, ancestor_depth in ancestors
+                for descendant_id, descendant_depth in subtree
+            ])
+
 
 class Building(BaseModel, GeoItem):
     user_profile = models.ForeignKey(
@@ -38,6 +130,14 @@ class Building(BaseModel, GeoItem):
     is_featured = models.BooleanField(default=False)
     contact_name = models.CharField(max_length=50, null=True, blank=False)
     contact_number = models.CharField(max_length=25, null=True, blank=True)
+    # Maintained by a database trigger on PostgreSQL, see places.search
+    search_vector = SearchVectorField(null=True, editable=False)
+    # Review statistics, kept up to date by the Review signals in places.signals
+    review_count = models.PositiveIntegerField(default=0, editable=False)
+    sentiment_count = models.PositiveIntegerField(default=0, editable=False)  # Reviews with a sentiment score
+    sentiment_sum = models.FloatField(default=0, editable=False)
+    avg_sentiment = models.FloatField(null=True, blank=True, editable=False)
+    sentiment_label = models.CharField(max_length=20, default=NO_REVIEWS_LABEL, editable=False)
     
     @property
     def geomap_longitude(self):
@@ -50,10 +150,46 @@ class Building(BaseModel, GeoItem):
     class Meta:
         managed = True
         ordering = ['-updated_at',]
+        indexes = [
+            models.Index(fields=['latitude', 'longitude']),
+        ]
     
     def __str__(self):
         return f'{self.name} - {self.address}'
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Icon file the sprite sheet was built with, see places.signals
+        if 'map_icon' in field_names:
+            instance._loaded_map_icon = values[field_names.index('map_icon')] or ''
+        return instance
+
+    @classmethod
+    def adjust_review_stats(cls, pk, review_delta=0, scored_delta=0, score_delta=0.0):
+        """
+        Atomically apply a review change to the stored statistics with F() expressions,
+        recomputing the average and label in the same UPDATE.
+        """
+        review_count = F('review_count') + review_delta
+        sentiment_count = F('sentiment_count') + scored_delta
+        avg_sentiment = ExpressionWrapper(
+            (F('sentiment_sum') + score_delta) / NullIf(sentiment_count, 0), output_field=models.FloatField()
+        )
+        cls.objects.filter(pk=pk).update(
+            review_count=review_count,
+            sentiment_count=sentiment_count,
+            sentiment_sum=F('sentiment_sum') + score_delta,
+            avg_sentiment=avg_sentiment,
+            sentiment_label=Case(
+                When(Exact(review_count, 0), then=Value(NO_REVIEWS_LABEL)),
+                When(IsNull(avg_sentiment, True), then=Value('')),
+                When(GreaterThan(avg_sentiment, 0.05), then=Value('positive')),
+                When(LessThan(avg_sentiment, -0.05), then=Value('negative')),
+                default=Value('neutral'),
+            ),
+        )
+
 
 
 class Rental(Building):
@@ -142,6 +278,9 @@ class FoodEstablishment(Building):
 class BuildingPhoto(BaseModel):
     building = models.ForeignKey(Building, related_name='photos', on_delete=models.CASCADE)
     image = models.ImageField(upload_to='building_photos/')
+    # Resized copies made in the background (see places.renditions):
+    # {'source': image name, 'thumbnail': {'name': ..., 'width': ..., 'height': ...}, ...}
+    renditions = models.JSONField(default=dict, blank=True, editable=False)
 
     def __str__(self):
         return f'Photo for {self.building}'
@@ -161,27 +300,48 @@ class Review(BaseModel):
 
     def __str__(self):
         return f'Review for {self.content_object} by {self.user_profile}'
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what the stored statistics were computed from, see places.signals
+        instance._loaded_stats = instance.stats_contribution()
+        instance._loaded_comment = instance.comment
+        return instance
+
+    def stats_contribution(self):
+        """ (content_type_id, object_id, sentiment_score) as counted in Building review stats. """
+        return (self.content_type_id, self.object_id, self.sentiment_score)
     
     def analyze_sentiment(self):
         """
         Perform sentiment analysis on the comment field and update sentiment_label and sentiment_score.
         """
         if self.comment:
-            # Using VADER
-            analyzer = SentimentIntensityAnalyzer()
-            sentiment = analyzer.polarity_scores(self.comment)
-            self.sentiment_score = sentiment['compound']
-            if sentiment['compound'] >= 0.05:
-                self.sentiment_label = 'Positive'
-            elif sentiment['compound'] <= -0.05:
-                self.sentiment_label = 'Negative'
-            else:
-                self.sentiment_label = 'Neutral'
+            # Using VADER, with the analyzer shared across requests
+            self.sentiment_label, self.sentiment_score = score_text(self.comment)
+
+    def reset_sentiment(self):
+        """
+        Mark the sentiment of a new or edited comment as pending; a background worker
+        scores it after the save (see places.sentiment). Without a comment there is nothing to score.
+        """
+        if not self.comment:
+            self.sentiment_label, self.sentiment_score = None, None
+        elif getattr(settings, 'PLACES_SENTIMENT_ASYNC', True):
+            self.sentiment_label, self.sentiment_score = SENTIMENT_PENDING, None
+        else:
+            self.analyze_sentiment()
 
     def save(self, *args, **kwargs):
-        # Perform sentiment analysis before saving
-        self.analyze_sentiment()
+        update_fields = kwargs.get('update_fields')
+        if (update_fields is None or 'comment' in update_fields) and self.comment != getattr(self, '_loaded_comment', None):
+            self.reset_sentiment()
+            # update_or_create() saves only the changed fields, the new scores have to go with them
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'sentiment_label', 'sentiment_score'}
         super().save(*args, **kwargs)
+        self._loaded_comment = self.comment
 
 class RentalFavorite(models.Model):
     user_profile = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='rental_favorites')
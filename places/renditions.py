@@ -0,0 +1,94 @@
+import io
+import os
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .cache import invalidate_catalog
+from .workers import submit_on_commit
+
+# Rendition name -> (bounding box, Pillow format, file extension, save options)
+RENDITIONS = {
+    'thumbnail': ((320, 320), 'JPEG', 'jpg', {'quality': 80, 'optimize': True}),
+    'detail': ((1280, 1280), 'JPEG', 'jpg', {'quality': 85, 'optimize': True}),
+    'webp': ((1280, 1280), 'WEBP', 'webp', {'quality': 80, 'method': 4}),
+}
+RENDITION_DIR = 'building_photos/renditions/'
+
+
+def needs_renditions(photo):
+    return bool(photo.image) and photo.renditions.get('source') != photo.image.name
+
+
+def generate_renditions(photo):
+    """
+    Resize the photo's image into every entry of RENDITIONS and store the files next to
+    the original. Returns the new value of `photo.renditions`.
+    """
+    storage = photo.image.storage
+    with photo.image.open('rb') as image_file:
+        image = ImageOps.exif_transpose(Image.open(image_file))
+        image.load()
+
+    renditions = {'source': photo.image.name}
+    base = os.path.splitext(os.path.basename(photo.image.name))[0]
+    for name, (size, image_format, extension, options) in RENDITIONS.items():
+        rendition = image.copy()
+        rendition.thumbnail(size, Image.LANCZOS)
+        if image_format == 'JPEG' and rendition.mode != 'RGB':
+            rendition = rendition.convert('RGB')
+
+        byte_arr = io.BytesIO()
+        rendition.save(byte_arr, format=image_format, **options)
+        file_name = f'{RENDITION_DIR}{photo.pk}_{base}_{name}.{extension}'
+        if storage.exists(file_name):
+            storage.delete(file_name)
+        file_name = storage.save(file_name, ContentFile(byte_arr.getvalue()))
+        renditions[name] = {'name': file_name, 'width': rendition.width, 'height': rendition.height}
+
+    for name, previous in photo.renditions.items():
+        # Drop files left behind by an earlier image of this photo
+        if name != 'source' and previous.get('name') not in (None, renditions.get(name, {}).get('name')):
+            storage.delete(previous['name'])
+    return renditions
+
+
+def rendition_urls(photo, absolute_url=None):
+    """ Url and size of each rendition, empty until the worker has resized the current image. """
+    if photo.renditions.get('source') != photo.image.name:
+        return {}
+    storage = photo.image.storage
+    renditions = {}
+    for name, rendition in photo.renditions.items():
+        if name == 'source':
+            continue
+        url = storage.url(rendition['name'])
+        renditions[name] = {
+            'url': absolute_url(url) if absolute_url else url,
+            'width': rendition['width'],
+            'height': rendition['height'],
+        }
+    return renditions
+
+
+def render_photo(pk, force=False):
+    """ Generate and save the renditions of one BuildingPhoto. Returns False if nothing was done. """
+    from .models import BuildingPhoto
+
+    photo = BuildingPhoto.objects.filter(pk=pk).first()
+    if photo is None or not photo.image or (not force and not needs_renditions(photo)):
+        return False
+
+    renditions = generate_renditions(photo)
+    # Only store them if the image wasn't replaced while we were resizing
+    # updated_at moves too, it is part of the place detail ETag (see BaseRetrieveUpdateView)
+    if BuildingPhoto.objects.filter(pk=pk, image=photo.image.name).update(renditions=renditions, updated_at=timezone.now()):
+        invalidate_catalog()
+    return True
+
+
+def schedule_renditions(photo):
+    """ Queue rendition generation once the transaction that saved the photo commits. """
+    submit_on_commit('photo-renditions', getattr(settings, 'PLACES_RENDITION_WORKERS', 2), render_photo, photo.pk)
@@ -0,0 +1,126 @@
+import logging
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramSimilarity
+from django.db import connection, connections
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Greatest
+
+BUILDING_FTS_TABLE = 'places_building_fts'
+
+# FTS5 table -> (content table, indexed columns), created by migration 0025
+SQLITE_FTS = {
+    BUILDING_FTS_TABLE: ('places_building', ['name', 'address', 'description']),
+}
+
+logger = logging.getLogger(__name__)
+
+_fts_tables = None
+
+
+def search_terms(query):
+    """ Split a user query into plain word tokens, dropping any search operator syntax. """
+    return re.findall(r'\w+', query or '')
+
+
+def has_fts_table(table):
+    """ Whether the SQLite FTS5 table was created (FTS5 is optional in SQLite builds). """
+    global _fts_tables
+    if _fts_tables is None:
+        _fts_tables = set(connection.introspection.table_names())
+    return table in _fts_tables
+
+
+def sqlite_fts_triggers(table, base_table, columns):
+    """ The triggers that keep an external-content FTS5 table in sync with its table. """
+    column_list = ', '.join(columns)
+    new_values = ', '.join(f'new.{column}' for column in columns)
+    old_values = ', '.join(f'old.{column}' for column in columns)
+    return {
+        f'{table}_ai': f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_ai AFTER INSERT ON {base_table} BEGIN
+                INSERT INTO {table}(rowid, {column_list}) VALUES (new.id, {new_values});
+            END
+        """,
+        f'{table}_ad': f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_ad AFTER DELETE ON {base_table} BEGIN
+                INSERT INTO {table}({table}, rowid, {column_list}) VALUES ('delete', old.id, {old_values});
+            END
+        """,
+        f'{table}_au': f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_au AFTER UPDATE ON {base_table} BEGIN
+                INSERT INTO {table}({table}, rowid, {column_list}) VALUES ('delete', old.id, {old_values});
+                INSERT INTO {table}(rowid, {column_list}) VALUES (new.id, {new_values});
+            END
+        """,
+    }
+
+
+def ensure_search_triggers(sender, using='default', **kwargs):
+    """
+    post_migrate handler, connected in PlacesConfig.ready. On SQLite, Django alters a table
+    by copying it into a new one, which silently drops the FTS5 sync triggers on it. Recreate
+    any that are missing and reindex the rows they missed, whichever migration dropped them.
+    """
+    db = connections[using]
+    if db.vendor != 'sqlite':
+        return
+    tables = set(db.introspection.table_names())
+    with db.cursor() as cursor:
+        for table, (base_table, columns) in SQLITE_FTS.items():
+            if table not in tables:
+                continue  # No FTS5 in this SQLite build, search falls back to icontains
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = %s", [base_table])
+            existing = {row[0] for row in cursor.fetchall()}
+            missing = {name: sql for name, sql in sqlite_fts_triggers(table, base_table, columns).items() if name not in existing}
+            if not missing:
+                continue
+            for sql in missing.values():
+                cursor.execute(sql)
+            cursor.execute(f"INSERT INTO {table}({table}) VALUES ('rebuild')")
+            logger.warning('Recreated FTS5 triggers %s and reindexed %s', ', '.join(sorted(missing)), table)
+
+
+def search_places(queryset, query):
+    """
+    Filter a Building (Rental/FoodEstablishment) queryset by name, description and
+    address, and annotate a `search_rank` where higher means more relevant.
+
+    PostgreSQL matches the trigger-maintained `search_vector` column (GIN indexed) and
+    falls back to trigram similarity on name/address for typos. SQLite uses the FTS5
+    table kept in sync by triggers. Anything else uses the old icontains scan.
+    """
+    terms = search_terms(query)
+    if connection.vendor == 'postgresql' and terms:
+        # Prefix match every word, so partially typed words still hit the index
+        search_query = SearchQuery(' & '.join(f'{term}:*' for term in terms), search_type='raw', config='simple')
+        return queryset.annotate(
+            search_rank=SearchRank(F('search_vector'), search_query) + Greatest(
+                TrigramSimilarity('name', query), TrigramSimilarity('address', query)
+            ),
+        ).filter(
+            Q(search_vector=search_query) | Q(name__trigram_similar=query) | Q(address__trigram_similar=query)
+        )
+
+    if connection.vendor == 'sqlite' and terms and has_fts_table(BUILDING_FTS_TABLE):
+        return _fts5_search(queryset, BUILDING_FTS_TABLE, 'places_building', terms)
+
+    return queryset.filter(
+        Q(name__icontains=query) | Q(description__icontains=query) | Q(address__icontains=query)
+    ).annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+
+def _fts5_search(queryset, fts_table, base_table, terms):
+    # Quote each token so FTS5 treats it literally, and prefix match it
+    match = ' '.join(f'"{term}"*' for term in terms)
+    return queryset.filter(
+        pk__in=RawSQL(f'SELECT rowid FROM {fts_table} WHERE {fts_table} MATCH %s', [match])
+    ).annotate(
+        # bm25() is lower for better matches, negate it so higher ranks first like PostgreSQL
+        search_rank=RawSQL(
+            f'SELECT -bm25({fts_table}) FROM {fts_table} WHERE {fts_table} MATCH %s AND rowid = "{base_table}"."id"',
+            [match],
+            output_field=FloatField(),
+        ),
+    )
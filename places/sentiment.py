@@ -0,0 +1,115 @@
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .cache import invalidate_catalog
+from .workers import get_executor, run_job, submit_on_commit
+
+SENTIMENT_PENDING = 'Pending'
+
+_analyzer = None
+_analyzer_lock = threading.Lock()
+_last_sweep = None
+_sweep_lock = threading.Lock()
+
+
+def get_analyzer():
+    """
+    Process-wide VADER analyzer. Building one loads the lexicon from nltk_data, so it is
+    created on first use and shared by every request afterwards (polarity_scores is read-only).
+    NLTK itself is only imported here, processes that never score a review don't load it.
+    """
+    global _analyzer
+    if _analyzer is None:
+        with _analyzer_lock:
+            if _analyzer is None:
+                import nltk
+                from nltk.sentiment.vader import SentimentIntensityAnalyzer
+
+                data_dir = getattr(settings, 'NLTK_DATA_DIR', None)
+                if data_dir and data_dir not in nltk.data.path:
+                    nltk.data.path.append(data_dir)
+                _analyzer = SentimentIntensityAnalyzer()
+    return _analyzer
+
+
+def label_for_score(compound):
+    if compound >= 0.05:
+        return 'Positive'
+    elif compound <= -0.05:
+        return 'Negative'
+    return 'Neutral'
+
+
+def score_text(text):
+    """ (sentiment_label, sentiment_score) for a review comment. """
+    compound = get_analyzer().polarity_scores(text)['compound']
+    return label_for_score(compound), compound
+
+
+def score_review(pk):
+    """ Fill in the sentiment of a pending review, background job queued by places.signals. """
+    from .models import Review
+    from .signals import update_review_stats
+
+    review = Review.objects.filter(pk=pk, sentiment_label=SENTIMENT_PENDING).first()
+    if review is None or not review.comment:
+        return False
+
+    # Score outside the transaction, VADER is the slow part
+    label, score = score_text(review.comment)
+    with transaction.atomic():
+        # Write first so the transaction starts with the write lock (SQLite can't upgrade a
+        # read lock under contention), and only if the review wasn't edited or deleted meanwhile
+        updated = Review.objects.filter(pk=pk, comment=review.comment, sentiment_label=SENTIMENT_PENDING).update(
+            sentiment_label=label, sentiment_score=score,
+        )
+        if not updated:
+            return False  # An edit queued its own job
+        review.sentiment_label, review.sentiment_score = label, score
+        update_review_stats(Review, review, created=False)
+    invalidate_catalog()
+    return True
+
+
+def schedule_scoring(review):
+    submit_on_commit('review-sentiment', getattr(settings, 'PLACES_SENTIMENT_WORKERS', 1), score_review, review.pk)
+
+
+def score_stale_reviews(limit=100):
+    """
+    Score reviews that are still pending PLACES_SENTIMENT_RETRY_AFTER seconds after their
+    last edit, i.e. whose job was lost when a worker restarted or was killed before it ran.
+    """
+    from .models import Review
+
+    cutoff = timezone.now() - timedelta(seconds=getattr(settings, 'PLACES_SENTIMENT_RETRY_AFTER', 300))
+    pks = list(
+        Review.objects.filter(sentiment_label=SENTIMENT_PENDING, updated_at__lt=cutoff)
+        .order_by('pk').values_list('pk', flat=True)[:limit]
+    )
+    # score_review only writes a review that is still pending, so other processes sweeping
+    # the same rows at the same time don't score anything twice
+    return sum(score_review(pk) for pk in pks)
+
+
+def sweep_stale_reviews():
+    """
+    Queue score_stale_reviews on the scoring pool, at most once per PLACES_SENTIMENT_SWEEP_INTERVAL
+    seconds per process. Called from request_started, so the first request after a restart
+    picks up what the previous process left pending.
+    """
+    global _last_sweep
+    interval = getattr(settings, 'PLACES_SENTIMENT_SWEEP_INTERVAL', 60)
+    if not interval or not getattr(settings, 'PLACES_SENTIMENT_ASYNC', True):
+        return
+    now = time.monotonic()
+    with _sweep_lock:
+        if _last_sweep is not None and now - _last_sweep < interval:
+            return
+        _last_sweep = now
+    get_executor('review-sentiment', getattr(settings, 'PLACES_SENTIMENT_WORKERS', 1)).submit(run_job, score_stale_reviews)
@@ -1,16 +1,19 @@
 from rest_framework import serializers
-from django.db.models import Avg
+from django.db import models
+from django.db.models import prefetch_related_objects
 from .models import Rental, FoodEstablishment, Category, Review, BuildingPhoto, RentalFavorite
 from django.contrib.contenttypes.models import ContentType
 from user_profile.serializers import ProfileSerializer
-from PIL import Image
-import io
-import base64
+from .icons import encode_map_icon
+from .sprites import map_icon_key
+from .renditions import rendition_urls
 
 class BuildingPhotoSerializer(serializers.ModelSerializer):
+    renditions = serializers.SerializerMethodField()
+
     class Meta:
         model = BuildingPhoto
-        fields = ['id', 'image']
+        fields = ['id', 'image', 'renditions']
     
     
     def get_image(self, obj):
@@ -18,6 +21,10 @@ class BuildingPhotoSerializer(serializers.ModelSerializer):
         if request and obj.image:
             return request.build_absolute_uri(obj.image.url)  # Return full URL
         return None  # Return None if image doesn't exist or request is not available
+
+    def get_renditions(self, obj):
+        request = self.context.get('request')
+        return rendition_urls(obj, request.build_absolute_uri if request else None)
        
 class ReviewSerializer(serializers.ModelSerializer):
     user_profile = ProfileSerializer(read_only=True)
@@ -57,91 +64,134 @@ class CategorySerializer(serializers.ModelSerializer):
 
 
     def get_subcategories(self, obj):
-        # Access the subcategories of the current category
-        if obj.subcategories.exists():
-            return SubcategorySerializer(obj.subcategories.all(), many=True).data
-        return []
+        # Access the subcategories of the current category; .all() reuses the prefetch
+        return SubcategorySerializer(obj.subcategories.all(), many=True).data
     
-class RentalSerializer(serializers.ModelSerializer):
+class PlaceListSerializer(serializers.ListSerializer):
+    """ Preloads the per-place review and favorite data for a whole page in a few queries. """
+
+    def to_representation(self, data):
+        iterable = data.all() if isinstance(data, models.manager.BaseManager) else data
+        objects = list(iterable)
+        self.child.preload(objects)
+        return [self.child.to_representation(item) for item in objects]
+
+
+class PlaceStatsMixin:
+    """
+    Review, favorite and map icon fields shared by the Rental and FoodEstablishment serializers.
+
+    preload() fetches the current user's reviews and favorites for a batch of places with
+    one query each, instead of several queries per place; the SerializerMethodFields read
+    from those maps. Review counts and sentiment come from the stored Building stats.
+    A place that was not preloaded (detail views) is preloaded on its own.
+    """
+
+    def get_user_profile(self):
+        request = self.context.get('request', None)
+        if request and request.user.is_authenticated:
+            return request.user.profile
+        return None
+
+    def preload(self, objects):
+        model = self.Meta.model
+        ids = [obj.pk for obj in objects]
+        prefetch_related_objects(objects, *self.Meta.prefetch)
+
+        user_reviews = {}
+        favorite_ids = set()
+        user_profile = self.get_user_profile()
+        if user_profile is not None:
+            content_type = ContentType.objects.get_for_model(model)
+            user_reviews = {
+                review.object_id: review
+                for review in Review.objects.filter(
+                    content_type=content_type, object_id__in=ids, user_profile=user_profile
+                ).select_related('user_profile__user')
+            }
+            # favorited_by is the reverse relation of RentalFavorite/FoodEstablishmentFavorite
+            favorite_field = model._meta.get_field('favorited_by')
+            favorite_ids = set(
+                favorite_field.related_model.objects.filter(
+                    user_profile=user_profile, **{f'{favorite_field.field.name}_id__in': ids}
+                ).values_list(f'{favorite_field.field.name}_id', flat=True)
+            )
+
+        preloaded = getattr(self, '_preloaded', {})
+        for pk in ids:
+            preloaded[pk] = {
+                'user_review': user_reviews.get(pk),
+                'is_favorited': pk in favorite_ids,
+            }
+        self._preloaded = preloaded
+
+    def get_preloaded(self, obj):
+        preloaded = getattr(self, '_preloaded', {})
+        if obj.pk not in preloaded:
+            self.preload([obj])
+        return self._preloaded[obj.pk]
+
+    def get_is_favorited(self, obj):
+        return self.get_preloaded(obj)['is_favorited']
+
+    def get_user_has_reviewed(self, obj):
+        return self.get_preloaded(obj)['user_review'] is not None
+
+    def get_user_review(self, obj):
+        review = self.get_preloaded(obj)['user_review']
+        if review is None:
+            return None
+        return ReviewSerializer(review).data  # Serialize the review
+
+    def get_map_icon_format(self):
+        request = self.context.get('request', None)
+        return request.GET.get('map_icon_format') if request else None
+
+    def get_map_icon_bitmap(self, obj):
+        # With ?map_icon_format=url or =sprite clients load the `map_icon` URL or the sprite
+        # sheet instead of inline base64
+        if self.get_map_icon_format() in ('url', 'sprite'):
+            return None
+        return encode_map_icon(obj.map_icon)
+
+    def get_map_icon_key(self, obj):
+        # Key of the icon in the places/map-icons/ sprite index
+        return map_icon_key(obj.map_icon)
+
+    def get_total_review(self, obj):
+        # Stored on Building and maintained incrementally, see Building.adjust_review_stats
+        return obj.review_count
+
+    def get_sentiment_label(self, obj):
+        return obj.sentiment_label
+
+
+class RentalSerializer(PlaceStatsMixin, serializers.ModelSerializer):
     categories = serializers.SerializerMethodField()  
     user_profile = ProfileSerializer(read_only=True)
     photos = BuildingPhotoSerializer(many=True, read_only=True) 
     map_icon_bitmap = serializers.SerializerMethodField()
+    map_icon_key = serializers.SerializerMethodField()
     is_favorited = serializers.SerializerMethodField()
     user_has_reviewed = serializers.SerializerMethodField()
     user_review = serializers.SerializerMethodField()
     total_review = serializers.SerializerMethodField()
     sentiment_label = serializers.SerializerMethodField()  # Added field
+    distance_km = serializers.SerializerMethodField()
 
 
     class Meta:
         model = Rental
-        fields = '__all__'
-    
-    
-    def get_user_has_reviewed(self, obj):
-        user = self.context['request'].user
-        if not user.is_authenticated:
-            return False
-
-        # Check if the user has already reviewed this rental
-        return Review.objects.filter(
-            content_type=ContentType.objects.get_for_model(Rental),
-            object_id=obj.id,
-            user_profile=user.profile  # Assuming user has a related user profile
-        ).exists()
+        exclude = ['search_vector', 'sentiment_count', 'sentiment_sum']
+        list_serializer_class = PlaceListSerializer
+        prefetch = ('user_profile__user', 'photos', 'categories__parent')
+
+    def get_distance_km(self, obj):
+        # Only set when the queryset was annotated by a distance filter
+        distance = getattr(obj, 'distance', None)
+        return round(distance, 3) if distance is not None else None
     
-    def get_user_review(self, obj):
-        user = self.context['request'].user
-        if not user.is_authenticated:
-            return None
 
-        # Retrieve the review if it exists, else return None
-        try:
-            review = Review.objects.get(
-                content_type=ContentType.objects.get_for_model(Rental),
-                object_id=obj.id,
-                user_profile=user.profile
-            )
-            return ReviewSerializer(review).data  # Serialize the review
-        except Review.DoesNotExist:
-            return None
-    
-    def get_total_review(self, obj):
-        return Review.objects.filter(
-                content_type=ContentType.objects.get_for_model(Rental),
-                object_id=obj.id,
-            ).count()
-    
-    def get_sentiment_label(self, obj):
-        # Filter reviews for the specific object_id
-        reviews = Review.objects.filter(content_type=ContentType.objects.get_for_model(Rental),object_id=obj.id)
-
-        # Check if there are reviews
-        if not reviews.exists():
-            return "No reviews found"
-
-        # Calculate the average sentiment score
-        average_sentiment_score = reviews.aggregate(avg_score=Avg('sentiment_score'))['avg_score']
-
-        # Determine the final sentiment label
-        if average_sentiment_score is not None:
-            if average_sentiment_score > 0.05:
-                return "positive"
-            elif average_sentiment_score < -0.05:
-                return "negative"
-            else:
-                return "neutral"
-
-        return ""
-
-    def get_is_favorited(self, obj):
-        request = self.context.get('request', None)
-        if request and request.user.is_authenticated:
-            # If user is authenticated, check if they have favorited this rental
-            return obj.favorited_by.filter(user_profile=request.user.profile).exists()
-        return False  # If user is not authenticated, always return False
-    
     def get_photos(self, obj):
         request = self.context.get('request')
         photo_urls = []
@@ -153,20 +203,6 @@ class RentalSerializer(serializers.ModelSerializer):
 
         return photo_urls
     
-    def get_map_icon_bitmap(self, obj):
-        if obj.map_icon and obj.map_icon.path:
-            try:
-                image = Image.open(obj.map_icon.path)
-
-                byte_arr = io.BytesIO()
-                image.save(byte_arr, format='PNG')  # Save as PNG instead of BMP
-                byte_arr = byte_arr.getvalue()
-
-                bitmap = base64.b64encode(byte_arr).decode('utf-8')
-                return bitmap
-            except (FileNotFoundError, OSError) as e:
-                return None
-        return None
 
     def get_categories(self, obj):
         category_dict = {}
@@ -201,102 +237,30 @@ class RentalSerializer(serializers.ModelSerializer):
         return list(category_dict.values()) 
 
     
-class FoodEstablishmentSerializer(serializers.ModelSerializer):
+class FoodEstablishmentSerializer(PlaceStatsMixin, serializers.ModelSerializer):
     categories = CategorySerializer(many=True)
     user_profile = ProfileSerializer(read_only=True)
     photos = BuildingPhotoSerializer(many=True, read_only=True)  # Include photos
     map_icon_bitmap = serializers.SerializerMethodField()
+    map_icon_key = serializers.SerializerMethodField()
     is_favorited = serializers.SerializerMethodField()
     user_has_reviewed = serializers.SerializerMethodField()
     user_review = serializers.SerializerMethodField()
     total_review = serializers.SerializerMethodField()
     sentiment_label = serializers.SerializerMethodField()  # Added field
+    distance_km = serializers.SerializerMethodField()
 
 
     class Meta:
         model = FoodEstablishment
-        fields = '__all__'
-    
-    def get_user_has_reviewed(self, obj):
-        user = self.context['request'].user
-        if not user.is_authenticated:
-            return False
-
-        # Check if the user has already reviewed this rental
-        return Review.objects.filter(
-            content_type=ContentType.objects.get_for_model(FoodEstablishment),
-            object_id=obj.id,
-            user_profile=user.profile  # Assuming user has a related user profile
-        ).exists()
-    
-    def get_user_review(self, obj):
-        user = self.context['request'].user
-        if not user.is_authenticated:
-            return None
-
-        # Retrieve the review if it exists, else return None
-        try:
-            review = Review.objects.get(
-                content_type=ContentType.objects.get_for_model(FoodEstablishment),
-                object_id=obj.id,
-                user_profile=user.profile
-            )
-            return ReviewSerializer(review).data  # Serialize the review
-        except Review.DoesNotExist:
-            return None
-    
-    def get_total_review(self, obj):
-        return Review.objects.filter(
-                content_type=ContentType.objects.get_for_model(FoodEstablishment),
-                object_id=obj.id,
-            ).count()
-    
-    def get_sentiment_label(self, obj):
-        # Filter reviews for the specific object_id
-        reviews = Review.objects.filter(content_type=ContentType.objects.get_for_model(FoodEstablishment),
-                    object_id=obj.id)
-
-        # Check if there are reviews
-        if not reviews.exists():
-            return "No reviews found"
-
-        # Calculate the average sentiment score
-        average_sentiment_score = reviews.aggregate(avg_score=Avg('sentiment_score'))['avg_score']
-
-        # Determine the final sentiment label
-        if average_sentiment_score is not None:
-            if average_sentiment_score > 0.05:
-                return "positive"
-            elif average_sentiment_score < -0.05:
-                return "negative"
-            else:
-                return "neutral"
-
-        return ""
-
-        
-    def get_is_favorited(self, obj):
-        request = self.context.get('request', None)
-        if request and request.user.is_authenticated:
-            # If user is authenticated, check if they have favorited this food establishment
-            return obj.favorited_by.filter(user_profile=request.user.profile).exists()
-        return False  # If user is not authenticated, always return False
-
-    def get_map_icon_bitmap(self, obj):
-        if obj.map_icon and obj.map_icon.path:
-            try:
-                image = Image.open(obj.map_icon.path)
-
-                byte_arr = io.BytesIO()
-                image.save(byte_arr, format='PNG')  # Save as PNG instead of BMP
-                byte_arr = byte_arr.getvalue()
-
-                bitmap = base64.b64encode(byte_arr).decode('utf-8')
-                return bitmap
-            except (FileNotFoundError, OSError) as e:
-                return None
-        return None
-
+        exclude = ['search_vector', 'sentiment_count', 'sentiment_sum']
+        list_serializer_class = PlaceListSerializer
+        prefetch = ('user_profile__user', 'photos', 'categories__subcategories')
+
+    def get_distance_km(self, obj):
+        # Only set when the queryset was annotated by a distance filter
+        distance = getattr(obj, 'distance', None)
+        return round(distance, 3) if distance is not None else None
 
 
 
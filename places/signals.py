@@ -0,0 +1,173 @@
+from django.contrib.contenttypes.models import ContentType
+from django.core.signals import request_started
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import invalidate_catalog, invalidate_category_tree
+from .models import Building, BuildingPhoto, Category, CategoryClosure, FoodEstablishment, Rental, Review
+from .sentiment import SENTIMENT_PENDING, schedule_scoring, sweep_stale_reviews
+from .suggest import CATEGORY, FOOD, RENTAL, suggestion_index
+
+
+@receiver(post_save, sender=Rental)
+@receiver(post_save, sender=FoodEstablishment)
+def update_spatial_index(sender, instance, **kwargs):
+    # Every process loads the signals, only import NumPy and PIL where they are used
+    from .spatial_index import spatial_index
+
+    kind = RENTAL if sender is Rental else FOOD
+    # A rolled back save must not leave the place in the index
+    pk, latitude, longitude = instance.pk, instance.latitude, instance.longitude
+    transaction.on_commit(lambda: spatial_index.add(pk, latitude, longitude, kind))
+
+
+@receiver(post_save, sender=Rental)
+@receiver(post_save, sender=FoodEstablishment)
+def precompute_map_icon(sender, instance, created, **kwargs):
+    from .icons import encode_map_icon
+    from .sprites import invalidate_sprite
+
+    # Only a new or replaced icon changes the sprite sheet, not every edit of the place
+    loaded = '' if created else getattr(instance, '_loaded_map_icon', None)
+    current = instance.map_icon.name or ''
+    if loaded == current:
+        return
+    instance._loaded_map_icon = current
+    # Encode a newly uploaded icon now instead of on the first search that returns it
+    encode_map_icon(instance.map_icon)
+    invalidate_sprite()
+
+
+@receiver(post_delete, sender=Rental)
+@receiver(post_delete, sender=FoodEstablishment)
+def invalidate_map_icon_sprite(sender, instance, **kwargs):
+    if instance.map_icon:
+        from .sprites import invalidate_sprite
+        invalidate_sprite()
+
+
+@receiver(post_delete, sender=Rental)
+@receiver(post_delete, sender=FoodEstablishment)
+def remove_from_spatial_index(sender, instance, **kwargs):
+    from .spatial_index import spatial_index
+
+    pk = instance.pk
+    transaction.on_commit(lambda: spatial_index.remove(pk))
+
+
+@receiver(post_save, sender=Rental)
+@receiver(post_save, sender=FoodEstablishment)
+def update_suggestion_index(sender, instance, **kwargs):
+    kind = RENTAL if sender is Rental else FOOD
+    pk, name, address = instance.pk, instance.name, instance.address
+    transaction.on_commit(lambda: suggestion_index.update(kind, pk, name=name, address=address))
+
+
+@receiver(post_save, sender=Category)
+def update_category_suggestion(sender, instance, **kwargs):
+    pk, name = instance.pk, instance.name
+    transaction.on_commit(lambda: suggestion_index.update(CATEGORY, pk, name=name))
+
+
+@receiver(post_delete, sender=Rental)
+@receiver(post_delete, sender=FoodEstablishment)
+def remove_from_suggestion_index(sender, instance, **kwargs):
+    kind, pk = RENTAL if sender is Rental else FOOD, instance.pk
+    transaction.on_commit(lambda: suggestion_index.remove(kind, pk))
+
+
+@receiver(post_delete, sender=Category)
+def remove_category_suggestion(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: suggestion_index.remove(CATEGORY, pk))
+
+
+@receiver(post_save, sender=Category)
+def update_category_closure(sender, instance, **kwargs):
+    CategoryClosure.link(instance)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_cached_category_tree(sender, instance, **kwargs):
+    invalidate_category_tree()
+
+
+def review_stats_deltas(contribution, sign, deltas):
+    """ Add one review's contribution to the per-building stat deltas, with sign +1 or -1. """
+    content_type_id, object_id, score = contribution
+    place_content_types = ContentType.objects.get_for_models(Rental, FoodEstablishment).values()
+    if content_type_id not in {content_type.id for content_type in place_content_types}:
+        return
+    review_delta, scored_delta, score_delta = deltas.get(object_id, (0, 0, 0.0))
+    if score is not None:
+        scored_delta += sign
+        score_delta += sign * score
+    deltas[object_id] = (review_delta + sign, scored_delta, score_delta)
+
+
+def apply_review_stats(deltas):
+    for object_id, (review_delta, scored_delta, score_delta) in deltas.items():
+        if review_delta or scored_delta or score_delta:
+            Building.adjust_review_stats(object_id, review_delta, scored_delta, score_delta)
+
+
+@receiver(post_save, sender=Review)
+def update_review_stats(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_loaded_stats', None)
+    current = instance.stats_contribution()
+    if previous == current:
+        return
+
+    deltas = {}
+    if previous is not None:
+        review_stats_deltas(previous, -1, deltas)
+    review_stats_deltas(current, 1, deltas)
+    apply_review_stats(deltas)
+    instance._loaded_stats = current
+
+
+@receiver(post_save, sender=Review)
+def queue_sentiment_scoring(sender, instance, raw=False, **kwargs):
+    # Reviews are saved unscored, the score and the place's stats follow from a worker thread
+    if not raw and instance.sentiment_label == SENTIMENT_PENDING:
+        schedule_scoring(instance)
+
+
+@receiver(request_started)
+def sweep_pending_reviews(sender, **kwargs):
+    # Jobs queued in memory die with their process, retry whatever they left pending
+    sweep_stale_reviews()
+
+
+@receiver(post_delete, sender=Review)
+def remove_review_stats(sender, instance, **kwargs):
+    deltas = {}
+    review_stats_deltas(getattr(instance, '_loaded_stats', instance.stats_contribution()), -1, deltas)
+    apply_review_stats(deltas)
+
+
+@receiver(post_save, sender=BuildingPhoto)
+def generate_photo_renditions(sender, instance, raw=False, **kwargs):
+    from .renditions import needs_renditions, schedule_renditions
+
+    # Resizing happens in a worker thread, the upload response doesn't wait for it
+    if not raw and needs_renditions(instance):
+        schedule_renditions(instance)
+
+
+@receiver(post_save, sender=Rental)
+@receiver(post_save, sender=FoodEstablishment)
+@receiver(post_save, sender=Review)
+@receiver(post_save, sender=BuildingPhoto)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Rental)
+@receiver(post_delete, sender=FoodEstablishment)
+@receiver(post_delete, sender=Review)
+@receiver(post_delete, sender=BuildingPhoto)
+@receiver(post_delete, sender=Category)
+@receiver(m2m_changed, sender=Building.categories.through)
+def invalidate_cached_responses(sender, **kwargs):
+    # Anonymous search responses are cached per catalog version, see places.cache
+    invalidate_catalog()
@@ -0,0 +1,281 @@
+import heapq
+import logging
+import math
+import sys
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+
+from .utils import EARTH_RADIUS_KM, DistanceMixin
+from .workers import get_executor, run_job
+
+logger = logging.getLogger(__name__)
+
+RENTAL = 'rental'
+FOOD = 'food'
+
+
+class SpatialGridIndex(DistanceMixin):
+    """
+    Per-process grid index over building coordinates.
+
+    Points are bucketed into square cells of `cell_size` degrees. A radius query only
+    visits the cells overlapping the query's bounding box, and a nearest query walks
+    rings of cells outwards from the query point, so neither touches the database.
+    The index is filled lazily on first use and patched by the Rental/FoodEstablishment
+    signals in places.signals. Since other worker processes can't see those signals,
+    the index is also reloaded once it is older than `max_age` seconds, on a background
+    thread while queries keep using the old copy, like the suggestion index.
+    """
+
+    def __init__(self, cell_size=0.05, max_age=300):
+        self.cell_size = cell_size
+        self.max_age = max_age
+        self._lock = threading.RLock()
+        self._build_lock = threading.Lock()
+        self._cells = {}  # (row, col) -> set of building ids
+        self._points = {}  # building id -> (latitude, longitude, kind)
+        self._built_at = None
+        self._refreshing = False
+        self._pending = None  # Changes made while a rebuild reads the database, replayed after the swap
+        self.rebuild_seconds = None
+
+    def _cell(self, latitude, longitude):
+        return (math.floor(latitude / self.cell_size), math.floor(longitude / self.cell_size))
+
+    def _ensure_built(self):
+        if self._built_at is None:
+            # Nothing to serve yet, the first query has to wait for the load
+            with self._build_lock:
+                if self._built_at is None:
+                    self.rebuild()
+        elif self.max_age and time.monotonic() - self._built_at > self.max_age:
+            self._refresh_in_background()
+
+    def _refresh_in_background(self):
+        """ Reload the index on a worker thread, queries keep using the current one meanwhile. """
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        get_executor('spatial-index', 1).submit(run_job, self._refresh)
+
+    def _refresh(self):
+        try:
+            self.rebuild()
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def rebuild(self):
+        """ Reload every rental and food establishment coordinate from the database. """
+        from .models import FoodEstablishment, Rental
+
+        with self._lock:
+            if self._pending is None:
+                self._pending = []
+        try:
+            start = time.perf_counter()
+            cells = {}
+            points = {}
+            for kind, model in ((RENTAL, Rental), (FOOD, FoodEstablishment)):
+                for pk, latitude, longitude in model.objects.values_list('id', 'latitude', 'longitude').order_by().iterator():
+                    points[pk] = (latitude, longitude, kind)
+                    cells.setdefault(self._cell(latitude, longitude), set()).add(pk)
+
+            with self._lock:
+                self._cells = cells
+                self._points = points
+                self._built_at = time.monotonic()
+                self.rebuild_seconds = time.perf_counter() - start
+                # The database was read before these changes were necessarily committed
+                for pk, point in self._pending:
+                    self._apply(pk, point)
+        finally:
+            with self._lock:
+                self._pending = None
+
+        logger.info('Spatial index rebuilt: %s', self.stats())
+
+    def add(self, pk, latitude, longitude, kind):
+        """ Insert or move a single building. """
+        self._change(pk, (latitude, longitude, kind))
+
+    def remove(self, pk):
+        self._change(pk, None)
+
+    def _change(self, pk, point):
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((pk, point))
+            if self._built_at is None:
+                return  # Not built yet, the first query will load it from the database
+            self._apply(pk, point)
+
+    def _apply(self, pk, point):
+        self._discard(pk)
+        if point is not None:
+            self._points[pk] = point
+            self._cells.setdefault(self._cell(point[0], point[1]), set()).add(pk)
+
+    def _discard(self, pk):
+        point = self._points.pop(pk, None)
+        if point is None:
+            return
+        cell = self._cell(point[0], point[1])
+        members = self._cells.get(cell)
+        if members is not None:
+            members.discard(pk)
+            if not members:
+                del self._cells[cell]
+
+    def within_radius(self, latitude, longitude, radius, kind=None):
+        """
+        Return {building_id: distance_km} for every point within `radius` km.
+        Pass `kind` ('rental' or 'food') to restrict the result to one model.
+        """
+        self._ensure_built()
+        with self._lock:
+            min_lat, max_lat, min_lon, max_lon = self.bounding_box(latitude, longitude, radius)
+            if min_lon is None:
+                candidates = self._points.keys()
+            else:
+                candidates = self._candidates(min_lat, max_lat, min_lon, max_lon)
+
+            pks, lats, lons = self._coordinates(candidates, kind)
+            distances, mask = self.haversine_many(longitude, latitude, lons, lats, radius)
+            return dict(zip(pks[mask].tolist(), distances[mask].tolist()))
+
+    def _coordinates(self, pks, kind=None):
+        """ Gather the ids and coordinates of the given buildings into NumPy arrays. """
+        points = self._points
+        if kind is not None:
+            pks = [pk for pk in pks if points[pk][2] == kind]
+        else:
+            pks = list(pks)
+        count = len(pks)
+        lats = np.fromiter((points[pk][0] for pk in pks), dtype=np.float64, count=count)
+        lons = np.fromiter((points[pk][1] for pk in pks), dtype=np.float64, count=count)
+        return np.array(pks, dtype=np.int64), lats, lons
+
+    def _candidates(self, min_lat, max_lat, min_lon, max_lon):
+        min_row, min_col = self._cell(min_lat, min_lon)
+        max_row, max_col = self._cell(max_lat, max_lon)
+        cols = max_col - min_col + 1
+        cols_per_globe = 2 * math.ceil(180 / self.cell_size)
+
+        if (max_row - min_row + 1) * cols > len(self._cells):
+            # Sparse index: scanning the occupied cells is cheaper than probing the box
+            for (row, col), members in self._cells.items():
+                if min_row <= row <= max_row and (col - min_col) % cols_per_globe < cols:
+                    yield from members
+            return
+
+        for row in range(min_row, max_row + 1):
+            for col in range(min_col, max_col + 1):
+                yield from self._cells.get((row, self._wrap(col)), ())
+
+    def nearest(self, latitude, longitude, k, kind=None, max_radius=None):
+        """
+        Return up to `k` (distance_km, building_id) tuples ordered by distance.
+
+        Rings of cells are visited outwards from the query cell; the search stops as soon
+        as the k-th best distance is closer than anything the next ring could contain.
+        """
+        self._ensure_built()
+        with self._lock:
+            if k <= 0 or not self._points:
+                return []
+
+            origin_row, origin_col = self._cell(latitude, longitude)
+            max_ring = math.ceil(180 / self.cell_size)
+            best = []  # max-heap of (-distance, pk)
+            seen = 0
+            ring = 0
+
+            while ring <= max_ring and seen < len(self._points):
+                if 8 * ring > len(self._cells):
+                    # The rings now cover more cells than are occupied, so scan every point instead
+                    return self._scan_nearest(latitude, longitude, k, kind, max_radius)
+                ring_pks = []
+                for cell in self._ring(origin_row, origin_col, ring):
+                    ring_pks.extend(self._cells.get(cell, ()))
+                seen += len(ring_pks)
+
+                pks, lats, lons = self._coordinates(ring_pks, kind)
+                distances, mask = self.haversine_many(longitude, latitude, lons, lats, max_radius)
+                for distance, pk in zip(distances[mask].tolist(), pks[mask].tolist()):
+                    if len(best) < k:
+                        heapq.heappush(best, (-distance, pk))
+                    elif distance < -best[0][0]:
+                        heapq.heapreplace(best, (-distance, pk))
+
+                # Every point outside the rings visited so far is at least this far away
+                reach = self._ring_reach(latitude, ring)
+                if len(best) == k and -best[0][0] <= reach:
+                    break
+                if max_radius is not None and reach > max_radius:
+                    break
+                ring += 1
+
+            return sorted((-distance, pk) for distance, pk in best)
+
+    def _scan_nearest(self, latitude, longitude, k, kind, max_radius):
+        pks, lats, lons = self._coordinates(self._points.keys(), kind)
+        distances, mask = self.haversine_many(longitude, latitude, lons, lats, max_radius)
+        pks, distances = pks[mask], distances[mask]
+        if len(distances) > k:
+            # Partial selection of the k smallest, only those k get sorted
+            top = np.argpartition(distances, k - 1)[:k]
+            pks, distances = pks[top], distances[top]
+        order = np.lexsort((pks, distances))
+        return list(zip(distances[order].tolist(), pks[order].tolist()))
+
+    def _ring(self, row, col, ring):
+        if ring == 0:
+            yield (row, col)
+            return
+        for c in range(col - ring, col + ring + 1):
+            yield (row - ring, self._wrap(c))
+            yield (row + ring, self._wrap(c))
+        for r in range(row - ring + 1, row + ring):
+            yield (r, self._wrap(col - ring))
+            yield (r, self._wrap(col + ring))
+
+    def _ring_reach(self, latitude, ring):
+        """ Lower bound, in km, on the distance to any cell beyond the given ring. """
+        degrees = ring * self.cell_size
+        # Longitude degrees shrink towards the poles, so use the most poleward latitude reached
+        shrink = math.cos(math.radians(min(abs(latitude) + degrees, 90.0)))
+        return math.radians(degrees) * EARTH_RADIUS_KM * shrink
+
+    def _wrap(self, col):
+        """ Wrap a column that fell past the antimeridian back onto the globe. """
+        half = math.ceil(180 / self.cell_size)
+        return (col + half) % (2 * half) - half
+
+    def stats(self):
+        """ Size, rebuild time and an approximate memory footprint of the index. """
+        with self._lock:
+            memory = sys.getsizeof(self._cells) + sys.getsizeof(self._points)
+            memory += sum(sys.getsizeof(members) for members in self._cells.values())
+            memory += sum(sys.getsizeof(point) for point in self._points.values())
+            return {
+                'size': len(self._points),
+                'cells': len(self._cells),
+                'cell_size': self.cell_size,
+                'rebuild_seconds': self.rebuild_seconds,
+                'approx_memory_bytes': memory,
+            }
+
+
+spatial_index = SpatialGridIndex(
+    cell_size=getattr(settings, 'PLACES_SPATIAL_INDEX_CELL_SIZE', 0.05),
+    max_age=getattr(settings, 'PLACES_SPATIAL_INDEX_MAX_AGE', 300),
+)
+
+
+def spatial_index_enabled():
+    return getattr(settings, 'PLACES_SPATIAL_INDEX_ENABLED', False)
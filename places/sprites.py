@@ -0,0 +1,122 @@
+import hashlib
+import io
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from PIL import Image
+
+from .cache import bump_version, get_version
+from .icons import map_icon_cache_key
+
+SPRITE_VERSION_KEY = 'places:map_icon_sprite:version'
+SPRITE_MAX_WIDTH = 1024  # Pixels per row before the packer starts a new shelf
+
+
+def map_icon_key(map_icon):
+    """
+    Content hash identifying an icon image in the sprite sheet, or None if there is no
+    readable icon. Identical uploads share one key and one slot in the sheet.
+    """
+    if not map_icon:
+        return None
+
+    try:
+        path = map_icon.path
+        key = f'{map_icon_cache_key(path)}:hash'
+    except (NotImplementedError, OSError, ValueError):
+        return None
+
+    digest = cache.get(key)
+    if digest is None:
+        try:
+            with open(path, 'rb') as icon_file:
+                digest = hashlib.sha1(icon_file.read()).hexdigest()[:16]
+        except OSError:
+            return None
+        cache.set(key, digest, timeout=None)
+    return digest
+
+
+def build_sprite():
+    """
+    Pack every distinct Building.map_icon into one PNG with a simple shelf packer:
+    icons are sorted by height and laid out left to right in rows of SPRITE_MAX_WIDTH.
+    """
+    from .models import Building
+
+    icons = {}  # icon key -> RGBA image
+    buildings = {}  # building id -> icon key
+    for building in Building.objects.exclude(map_icon='').exclude(map_icon__isnull=True).only('id', 'map_icon').order_by('id'):
+        key = map_icon_key(building.map_icon)
+        if key is None:
+            continue
+        if key not in icons:
+            try:
+                icons[key] = Image.open(building.map_icon.path).convert('RGBA')
+            except OSError:
+                continue
+        buildings[building.pk] = key
+
+    offsets = {}
+    x = y = shelf_height = width = 0
+    for key, image in sorted(icons.items(), key=lambda item: (-item[1].height, item[0])):
+        if x and x + image.width > SPRITE_MAX_WIDTH:
+            x, y, shelf_height = 0, y + shelf_height, 0
+        offsets[key] = {'x': x, 'y': y, 'width': image.width, 'height': image.height}
+        x += image.width
+        width = max(width, x)
+        shelf_height = max(shelf_height, image.height)
+
+    sheet = Image.new('RGBA', (max(width, 1), max(y + shelf_height, 1)), (0, 0, 0, 0))
+    for key, image in icons.items():
+        sheet.paste(image, (offsets[key]['x'], offsets[key]['y']))
+
+    byte_arr = io.BytesIO()
+    sheet.save(byte_arr, format='PNG', optimize=True)
+    png = byte_arr.getvalue()
+    sprite_hash = hashlib.sha1(png).hexdigest()[:16]
+    index = json.dumps([sprite_hash, offsets, buildings], sort_keys=True).encode()
+    return {
+        'hash': sprite_hash,
+        'index_hash': hashlib.sha1(index).hexdigest()[:16],
+        'png': png,
+        'icons': offsets,
+        'buildings': buildings,
+    }
+
+
+def icon_fingerprint():
+    """
+    Hash of which building has which icon file. It is read from the database, so every
+    worker process notices a changed icon, whichever process saved it.
+    """
+    from .models import Building
+
+    rows = Building.objects.exclude(map_icon='').exclude(map_icon__isnull=True).order_by('id').values_list('id', 'map_icon')
+    return hashlib.sha1(json.dumps(list(rows)).encode()).hexdigest()[:16]
+
+
+def get_sprite():
+    """
+    The current sprite sheet, rebuilt only when the icon fingerprint changes. The fingerprint
+    itself is cached for PLACES_MAP_ICON_FINGERPRINT_TIMEOUT seconds under the local version,
+    which the signals in places.signals bump whenever an icon is saved or deleted.
+    """
+    version = get_version(SPRITE_VERSION_KEY)
+    fingerprint_key = f'places:map_icon_fingerprint:{version}'
+    fingerprint = cache.get(fingerprint_key)
+    if fingerprint is None:
+        fingerprint = icon_fingerprint()
+        cache.set(fingerprint_key, fingerprint, timeout=getattr(settings, 'PLACES_MAP_ICON_FINGERPRINT_TIMEOUT', 30))
+
+    key = f'places:map_icon_sprite:{version}:{fingerprint}'
+    sprite = cache.get(key)
+    if sprite is None:
+        sprite = build_sprite()
+        cache.set(key, sprite, timeout=getattr(settings, 'PLACES_MAP_ICON_SPRITE_TIMEOUT', 86400))
+    return sprite
+
+
+def invalidate_sprite():
+    bump_version(SPRITE_VERSION_KEY)
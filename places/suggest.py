@@ -0,0 +1,180 @@
+import bisect
+import logging
+import re
+import threading
+import time
+import unicodedata
+
+from django.conf import settings
+
+from .workers import get_executor, run_job
+
+logger = logging.getLogger(__name__)
+
+RENTAL = 'rental'
+FOOD = 'food'
+CATEGORY = 'category'
+
+
+def normalize(text):
+    """ Casefold and strip accents so 'Café' and 'cafe' share a prefix. """
+    text = unicodedata.normalize('NFKD', text or '')
+    return ''.join(c for c in text if not unicodedata.combining(c)).casefold().strip()
+
+
+class PrefixIndex:
+    """
+    Per-process sorted-array prefix index for search box suggestions.
+
+    Every indexed text is stored once per word it contains, as the suffix starting at that
+    word, so 'Green Dormitory' is found by both 'gre' and 'dorm'. A lookup is one bisect
+    into the sorted key list, a bounded scan and a small sort of the matches. Entries are patched from
+    model signals (see places.signals). Once the index is older than `max_age` seconds it is
+    reloaded on a background thread so other worker processes catch up, while lookups keep
+    using the old copy until the new one is swapped in.
+    """
+
+    def __init__(self, max_age=300, scan_limit=200):
+        self.max_age = max_age
+        self.scan_limit = scan_limit  # Matches looked at per query before ranking
+        self._lock = threading.RLock()
+        self._build_lock = threading.Lock()
+        self._keys = []  # Sorted list of (normalized suffix, kind, id, field)
+        self._texts = {}  # (kind, id, field) -> (display text, normalized length)
+        self._built_at = None
+        self._refreshing = False
+        self._pending = None  # Changes made while a rebuild reads the database, replayed after the swap
+
+    def _entries(self, kind, pk, field, text):
+        normalized = normalize(text)
+        for match in re.finditer(r'\w+', normalized):
+            yield (normalized[match.start():], kind, pk, field)
+
+    def _ensure_built(self):
+        if self._built_at is None:
+            # Nothing to serve yet, the first lookup has to wait for the load
+            with self._build_lock:
+                if self._built_at is None:
+                    self.rebuild()
+        elif self.max_age and time.monotonic() - self._built_at > self.max_age:
+            self._refresh_in_background()
+
+    def _refresh_in_background(self):
+        """ Reload the index on a worker thread, lookups keep using the current one meanwhile. """
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        get_executor('suggest-index', 1).submit(run_job, self._refresh)
+
+    def _refresh(self):
+        try:
+            self.rebuild()
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def rebuild(self):
+        from .models import Category, FoodEstablishment, Rental
+
+        with self._lock:
+            if self._pending is None:
+                self._pending = []
+        try:
+            start = time.perf_counter()
+            keys = []
+            texts = {}
+            sources = [
+                (RENTAL, Rental.objects.values_list('id', 'name', 'address')),
+                (FOOD, FoodEstablishment.objects.values_list('id', 'name', 'address')),
+                (CATEGORY, Category.objects.values_list('id', 'name')),
+            ]
+            for kind, rows in sources:
+                for row in rows.order_by().iterator():
+                    pk = row[0]
+                    for field, text in zip(('name', 'address'), row[1:]):
+                        if text:
+                            texts[(kind, pk, field)] = (text, len(normalize(text)))
+                            keys.extend(self._entries(kind, pk, field, text))
+            keys.sort()
+
+            with self._lock:
+                self._keys = keys
+                self._texts = texts
+                self._built_at = time.monotonic()
+                # The database was read before these signals' changes were necessarily committed
+                for kind, pk, fields in self._pending:
+                    self._apply(kind, pk, fields)
+        finally:
+            with self._lock:
+                self._pending = None
+
+        logger.info('Suggestion index rebuilt with %s entries in %.3fs', len(keys), time.perf_counter() - start)
+
+    def update(self, kind, pk, **fields):
+        """ Replace the indexed texts of one object, e.g. update('rental', 1, name=..., address=...). """
+        self._change(kind, pk, fields)
+
+    def remove(self, kind, pk):
+        self._change(kind, pk, None)
+
+    def _change(self, kind, pk, fields):
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((kind, pk, fields))
+            if self._built_at is None:
+                return  # Not built yet, the first lookup will load it from the database
+            self._apply(kind, pk, fields)
+
+    def _apply(self, kind, pk, fields):
+        self._remove(kind, pk)
+        for field, text in (fields or {}).items():
+            if text:
+                self._texts[(kind, pk, field)] = (text, len(normalize(text)))
+                for entry in self._entries(kind, pk, field, text):
+                    bisect.insort(self._keys, entry)
+
+    def _remove(self, kind, pk):
+        for field in ('name', 'address'):
+            text, _ = self._texts.pop((kind, pk, field), (None, None))
+            if text is None:
+                continue
+            for entry in self._entries(kind, pk, field, text):
+                position = bisect.bisect_left(self._keys, entry)
+                if position < len(self._keys) and self._keys[position] == entry:
+                    del self._keys[position]
+
+    def suggest(self, prefix, limit=10):
+        """ Return up to `limit` suggestions whose name, address or a word in them starts with `prefix`. """
+        prefix = normalize(prefix)
+        if not prefix or limit < 1:
+            return []
+
+        self._ensure_built()
+        with self._lock:
+            start = bisect.bisect_left(self._keys, (prefix,))
+            matches = []
+            for key in self._keys[start:start + self.scan_limit]:
+                if not key[0].startswith(prefix):
+                    break
+                matches.append(key)
+
+            texts = self._texts
+            # Whole-text matches before mid-text word matches, names before addresses, shorter first
+            matches.sort(key=lambda key: (
+                len(key[0]) != texts[key[1:]][1], key[3] != 'name', texts[key[1:]][1],
+            ))
+
+            results = []
+            seen = set()
+            for suffix, kind, pk, field in matches:
+                if (kind, pk) in seen:
+                    continue
+                seen.add((kind, pk))
+                results.append({'type': kind, 'id': pk, 'field': field, 'text': texts[(kind, pk, field)][0]})
+                if len(results) == limit:
+                    break
+            return results
+
+
+suggestion_index = PrefixIndex(max_age=getattr(settings, 'PLACES_SUGGEST_INDEX_MAX_AGE', 300))
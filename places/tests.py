@@ -1,3 +1,567 @@
-from django.test import TestCase
+import datetime
+import io
+import random
+import shutil
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.test import TestCase, override_settings
+from PIL import Image
+from rest_framework.test import APIClient
+
+from user_profile.models import UserProfile
+from .cache import snap_coordinate
+from .management.commands.rebuild_review_stats import compute_review_stats
+from .models import Building, Category, CategoryClosure, FoodEstablishment, Rental, Review
+from .sentiment import SENTIMENT_PENDING, score_review
+from .spatial_index import FOOD, RENTAL, SpatialGridIndex, spatial_index
+from .suggest import suggestion_index
+from .utils import DistanceMixin
+
+
+def create_profile(username):
+    return UserProfile.objects.create(user=User.objects.create(username=username))
+
+
+def create_rental(owner, name, latitude=14.6, longitude=121.0):
+    return Rental.objects.create(
+        user_profile=owner, name=name, address='1 Main St', latitude=latitude, longitude=longitude,
+        contact_name='Owner', monthly_rent=1000,
+    )
+
+
+def create_food_establishment(owner, name, latitude=14.6, longitude=121.0):
+    return FoodEstablishment.objects.create(
+        user_profile=owner, name=name, address='2 Main St', latitude=latitude, longitude=longitude,
+        opening_time=datetime.time(8), closing_time=datetime.time(20), is_food_establishment=True,
+    )
+
+
+class ReviewStatsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = create_profile('owner')
+        cls.reviewer = create_profile('reviewer')
+        cls.other_reviewer = create_profile('other')
+        cls.rental = create_rental(cls.owner, 'Green Dorm')
+        cls.content_type = ContentType.objects.get_for_model(Rental)
+
+    def review(self, profile, comment):
+        return Review.objects.create(
+            content_type=self.content_type, object_id=self.rental.pk, user_profile=profile, comment=comment,
+        )
+
+    def stats(self):
+        return Building.objects.filter(pk=self.rental.pk).values(
+            'review_count', 'sentiment_count', 'sentiment_sum', 'avg_sentiment', 'sentiment_label',
+        ).get()
+
+    def assertStatsMatchRebuild(self):
+        """ The incrementally maintained stats equal a full recomputation from the reviews. """
+        stored = self.stats()
+        content_type_ids = [ct.id for ct in ContentType.objects.get_for_models(Rental, FoodEstablishment).values()]
+        compute_review_stats(Building, Review, content_type_ids)
+        rebuilt = self.stats()
+        self.assertEqual(stored['review_count'], rebuilt['review_count'])
+        self.assertEqual(stored['sentiment_count'], rebuilt['sentiment_count'])
+        self.assertAlmostEqual(stored['sentiment_sum'], rebuilt['sentiment_sum'])
+        self.assertEqual(stored['sentiment_label'], rebuilt['sentiment_label'])
+        if rebuilt['avg_sentiment'] is None:
+            self.assertIsNone(stored['avg_sentiment'])
+        else:
+            self.assertAlmostEqual(stored['avg_sentiment'], rebuilt['avg_sentiment'])
+
+    def test_no_reviews(self):
+        self.assertEqual(self.stats()['review_count'], 0)
+        self.assertEqual(self.stats()['sentiment_label'], 'No reviews found')
+
+    @override_settings(PLACES_SENTIMENT_ASYNC=False)
+    def test_create_edit_delete(self):
+        review = self.review(self.reviewer, 'great lovely place')
+        stats = self.stats()
+        self.assertEqual((stats['review_count'], stats['sentiment_count']), (1, 1))
+        self.assertEqual(stats['sentiment_label'], 'positive')
+        self.assertStatsMatchRebuild()
+
+        self.review(self.other_reviewer, 'awful dirty place')
+        self.assertEqual(self.stats()['review_count'], 2)
+        self.assertStatsMatchRebuild()
+
+        review.comment = 'terrible noisy rooms'
+        review.save()
+        stats = self.stats()
+        self.assertEqual((stats['review_count'], stats['sentiment_count']), (2, 2))
+        self.assertEqual(stats['sentiment_label'], 'negative')
+        self.assertStatsMatchRebuild()
+
+        review.delete()
+        self.assertEqual(self.stats()['review_count'], 1)
+        self.assertStatsMatchRebuild()
+
+        Review.objects.get().delete()
+        stats = self.stats()
+        self.assertEqual((stats['review_count'], stats['sentiment_count']), (0, 0))
+        self.assertIsNone(stats['avg_sentiment'])
+        self.assertEqual(stats['sentiment_label'], 'No reviews found')
+
+    @override_settings(PLACES_SENTIMENT_ASYNC=False)
+    def test_review_without_comment_is_counted_unscored(self):
+        self.review(self.reviewer, '')
+        stats = self.stats()
+        self.assertEqual((stats['review_count'], stats['sentiment_count']), (1, 0))
+        self.assertStatsMatchRebuild()
+
+    @override_settings(PLACES_SENTIMENT_ASYNC=True)
+    def test_background_score(self):
+        review = self.review(self.reviewer, 'great lovely place')
+        self.assertEqual(review.sentiment_label, SENTIMENT_PENDING)
+        stats = self.stats()
+        self.assertEqual((stats['review_count'], stats['sentiment_count']), (1, 0))
+
+        self.assertTrue(score_review(review.pk))
+        review.refresh_from_db()
+        self.assertEqual(review.sentiment_label, 'Positive')
+        stats = self.stats()
+        self.assertEqual((stats['review_count'], stats['sentiment_count']), (1, 1))
+        self.assertAlmostEqual(stats['sentiment_sum'], review.sentiment_score)
+        self.assertStatsMatchRebuild()
+
+        # A second run finds nothing pending and changes nothing
+        self.assertFalse(score_review(review.pk))
+        self.assertEqual(self.stats()['sentiment_count'], 1)
+
+    @override_settings(PLACES_SENTIMENT_ASYNC=True)
+    def test_score_of_edited_comment_is_dropped(self):
+        review = self.review(self.reviewer, 'great lovely place')
+
+        def edit_while_scoring(text):
+            # The review is edited between the worker reading it and writing the score
+            Review.objects.filter(pk=review.pk).update(comment='awful dirty place')
+            return 'Positive', 0.9
+
+        with mock.patch('places.sentiment.score_text', edit_while_scoring):
+            self.assertFalse(score_review(review.pk))
+        self.assertEqual(self.stats()['sentiment_count'], 0)
+
+
+class CategoryClosureTests(TestCase):
+
+    def setUp(self):
+        self.root = Category.objects.create(name='Housing')
+        self.child = Category.objects.create(name='Dorm', parent=self.root)
+        self.grandchild = Category.objects.create(name='Shared room', parent=self.child)
+        self.other_root = Category.objects.create(name='Food')
+
+    def ancestors(self, category):
+        return dict(CategoryClosure.objects.filter(descendant=category).values_list('ancestor_id', 'depth'))
+
+    def test_links(self):
+        self.assertEqual(self.ancestors(self.root), {self.root.pk: 0})
+        self.assertEqual(self.ancestors(self.grandchild), {self.grandchild.pk: 0, self.child.pk: 1, self.root.pk: 2})
+        self.assertEqual(Category.ancestor_ids(self.grandchild.pk), {self.grandchild.pk, self.child.pk, self.root.pk})
+
+    def test_hierarchy_ids_cover_the_whole_root_tree(self):
+        sibling = Category.objects.create(name='Apartment', parent=self.root)
+        other_child = Category.objects.create(name='Cafe', parent=self.other_root)
+        tree = {self.root.pk, self.child.pk, self.grandchild.pk, sibling.pk}
+        self.assertEqual(Category.hierarchy_ids([self.grandchild.pk]), tree)
+        self.assertEqual(Category.hierarchy_ids([sibling.pk]), tree)
+        self.assertEqual(Category.hierarchy_ids([self.root.pk, other_child.pk]), tree | {self.other_root.pk, other_child.pk})
+        self.assertEqual(Category.hierarchy_ids([0]), set())
+
+    def test_subtree_move(self):
+        self.child.parent = self.other_root
+        self.child.save()
+
+        self.assertEqual(self.ancestors(self.child), {self.child.pk: 0, self.other_root.pk: 1})
+        self.assertEqual(self.ancestors(self.grandchild), {self.grandchild.pk: 0, self.child.pk: 1, self.other_root.pk: 2})
+        self.assertEqual(
+            dict(CategoryClosure.objects.filter(ancestor=self.root).values_list('descendant_id', 'depth')),
+            {self.root.pk: 0},
+        )
+
+    def test_move_to_root(self):
+        self.child.parent = None
+        self.child.save()
+
+        self.assertEqual(self.ancestors(self.child), {self.child.pk: 0})
+        self.assertEqual(self.ancestors(self.grandchild), {self.grandchild.pk: 0, self.child.pk: 1})
+
+    def test_save_without_move_keeps_links(self):
+        before = set(CategoryClosure.objects.values_list('ancestor_id', 'descendant_id', 'depth'))
+        self.child.name = 'Dormitory'
+        self.child.save()
+        self.assertEqual(set(CategoryClosure.objects.values_list('ancestor_id', 'descendant_id', 'depth')), before)
+
+    def test_move_under_own_subtree_is_rejected(self):
+        before = set(CategoryClosure.objects.values_list('ancestor_id', 'descendant_id', 'depth'))
+        for category, parent in ((self.child, self.child), (self.child, self.grandchild), (self.root, self.grandchild)):
+            category.parent = parent
+            with self.assertRaises(ValidationError):
+                category.save()
+        self.assertEqual(set(CategoryClosure.objects.values_list('ancestor_id', 'descendant_id', 'depth')), before)
+        self.assertEqual(Category.objects.get(pk=self.child.pk).parent_id, self.root.pk)
+        self.assertIsNone(Category.objects.get(pk=self.root.pk).parent_id)
+
+    def test_delete_removes_subtree_links(self):
+        self.child.delete()
+        self.assertFalse(CategoryClosure.objects.filter(descendant_id=self.grandchild.pk).exists())
+        self.assertEqual(self.ancestors(self.root), {self.root.pk: 0})
+
+
+class PlaceSuggestViewTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        owner = create_profile('owner')
+        for i in range(25):
+            create_rental(owner, f'Green Dorm {i}')
+
+    def setUp(self):
+        self.client = APIClient()
+        suggestion_index.rebuild()
+
+    def suggest(self, **params):
+        return self.client.get('/api/places/suggest/', {'q': 'gre', **params})
+
+    def test_limit_is_clamped(self):
+        for limit, expected in ((None, 10), (0, 1), (-5, 1), (3, 3), (1000, 20)):
+            with self.subTest(limit=limit):
+                params = {} if limit is None else {'limit': limit}
+                result = self.suggest(**params)
+                self.assertEqual(result.status_code, 200)
+                self.assertEqual(len(result.json()['results']), expected)
+        self.assertEqual(self.suggest(limit='ten').status_code, 400)
+        self.assertEqual(self.suggest(q='').json()['results'], [])
+
+    def test_changes_wait_for_the_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            create_rental(Rental.objects.first().user_profile, 'Blue House')
+        self.assertEqual(self.suggest(q='blue').json()['results'], [])
+
+        for callback in callbacks:
+            callback()
+        self.assertEqual([suggestion['text'] for suggestion in self.suggest(q='blue').json()['results']], ['Blue House'])
+
+
+@override_settings(PLACES_RESPONSE_CACHE_TIMEOUT=0)
+class SearchCursorPaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        owner = create_profile('owner')
+        cls.rentals = [create_rental(owner, f'Rental {i}', latitude=14.6 + i * 0.001) for i in range(5)]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.url = '/api/places/rental/'
+
+    def test_cursor_walks_every_place_once(self):
+        seen = []
+        result = self.client.get(self.url, {'pagination': 'cursor', 'page_size': 2}).json()
+        self.assertNotIn('count', result)
+        while True:
+            seen.extend(place['id'] for place in result['results'])
+            if not result['next']:
+                break
+            result = self.client.get(result['next']).json()
+        self.assertEqual(sorted(seen), sorted(rental.pk for rental in self.rentals))
+        self.assertEqual(len(seen), len(set(seen)))
+
+    def test_unsupported_orderings(self):
+        location = {'latitude': 14.6, 'longitude': 121.0}
+        for params in (
+            {'pagination': 'cursor', 'ordering': 'distance', **location},
+            {'pagination': 'cursor', 'ordering': 'relevance', 'q': 'Rental'},
+            {'pagination': 'cursor', 'ordering': 'best_reviewed'},
+            {'ordering': 'distance'},  # Needs coordinates
+            {'ordering': 'relevance'},  # Needs a query
+        ):
+            with self.subTest(**params):
+                self.assertEqual(self.client.get(self.url, params).status_code, 400)
+
+        result = self.client.get(self.url, {'ordering': 'distance', **location})
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual([place['id'] for place in result.json()['results']], [rental.pk for rental in self.rentals])
+
+
+class PlaceDetailConditionalGetTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.rental = create_rental(create_profile('owner'), 'Green Dorm')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.url = f'/api/places/rental/detail/{self.rental.pk}/'
+
+    def test_validators_and_cache_headers(self):
+        result = self.client.get(self.url)
+        self.assertEqual(result.status_code, 200)
+        self.assertTrue(result['ETag'])
+        self.assertTrue(result['Last-Modified'])
+        self.assertEqual(result['Cache-Control'], 'private, no-cache')
+        self.assertIn('Authorization', result['Vary'])
+        self.assertIn('Cookie', result['Vary'])
+
+    def test_not_modified(self):
+        etag = self.client.get(self.url)['ETag']
+        result = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(result.status_code, 304)
+        self.assertEqual(result['ETag'], etag)
+        self.assertEqual(result['Cache-Control'], 'private, no-cache')
+
+    def test_change_moves_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        self.rental.description = 'Newly renovated'
+        self.rental.save()
+        result = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(result.status_code, 200)
+        self.assertNotEqual(result['ETag'], etag)
+
+
+class SpatialGridIndexTests(TestCase):
+    """ The grid index agrees with the haversine distance computed by the database. """
+
+    @classmethod
+    def setUpTestData(cls):
+        owner = create_profile('owner')
+        rng = random.Random(7)
+        for i in range(40):
+            create_rental(owner, f'Rental {i}', rng.uniform(14.4, 14.8), rng.uniform(120.8, 121.2))
+        for i in range(20):
+            create_food_establishment(owner, f'Food {i}', rng.uniform(14.4, 14.8), rng.uniform(120.8, 121.2))
+        # Either side of the antimeridian
+        create_rental(owner, 'East rental', -16.5, 179.99)
+        create_rental(owner, 'West rental', -16.5, -179.99)
+
+    def setUp(self):
+        self.index = SpatialGridIndex(cell_size=0.05, max_age=0)
+        self.index.rebuild()
+
+    def baseline(self, model, latitude, longitude):
+        return model.objects.annotate(distance=DistanceMixin().distance_expression(latitude, longitude))
+
+    def test_within_radius(self):
+        for latitude, longitude, radius in ((14.6, 121.0, 5), (14.6, 121.0, 15), (14.45, 120.85, 0.5), (-16.5, 180.0, 5)):
+            for kind, model in ((RENTAL, Rental), (FOOD, FoodEstablishment)):
+                with self.subTest(latitude=latitude, longitude=longitude, radius=radius, kind=kind):
+                    expected = dict(self.baseline(model, latitude, longitude).filter(distance__lte=radius).values_list('id', 'distance'))
+                    found = self.index.within_radius(latitude, longitude, radius, kind=kind)
+                    self.assertEqual(set(found), set(expected))
+                    for pk, distance in found.items():
+                        self.assertAlmostEqual(distance, expected[pk], places=6)
+
+    def test_nearest(self):
+        for latitude, longitude, k, max_radius in ((14.6, 121.0, 5, None), (14.5, 120.9, 10, 8), (10.0, 121.0, 3, None), (-16.5, 179.999, 2, None)):
+            for kind, model in ((RENTAL, Rental), (FOOD, FoodEstablishment)):
+                with self.subTest(latitude=latitude, longitude=longitude, k=k, max_radius=max_radius, kind=kind):
+                    expected = self.baseline(model, latitude, longitude)
+                    if max_radius is not None:
+                        expected = expected.filter(distance__lte=max_radius)
+                    expected = list(expected.order_by('distance', 'id').values_list('distance', 'id')[:k])
+                    found = self.index.nearest(latitude, longitude, k, kind=kind, max_radius=max_radius)
+                    self.assertEqual([pk for _, pk in found], [pk for _, pk in expected])
+                    for (distance, _), (expected_distance, _) in zip(found, expected):
+                        self.assertAlmostEqual(distance, expected_distance, places=6)
+
+    def test_changes_wait_for_the_commit(self):
+        spatial_index.rebuild()
+        rental = Rental.objects.order_by('id').first()
+        with self.captureOnCommitCallbacks() as callbacks:
+            rental.latitude, rental.longitude = 10.0, 10.0
+            rental.save()
+        self.assertNotIn(rental.pk, spatial_index.within_radius(10.0, 10.0, 1))
+
+        for callback in callbacks:
+            callback()
+        self.assertEqual(set(spatial_index.within_radius(10.0, 10.0, 1)), {rental.pk})
+
+
+class NearestPlacesViewTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        owner = create_profile('owner')
+        cls.rentals = [create_rental(owner, f'Rental {i}', latitude=14.6 + i * 0.01) for i in range(4)]
+        cls.food = create_food_establishment(owner, 'Food', latitude=14.605)
+
+    def setUp(self):
+        self.client = APIClient()
+        spatial_index.rebuild()
+
+    def nearest(self, **params):
+        return self.client.get('/api/places/nearest/', {'latitude': 14.6, 'longitude': 121.0, **params})
+
+    def test_invalid_parameters(self):
+        for params in ({'k': 0}, {'k': -3}, {'k': 'many'}, {'radius': 0}, {'radius': -1}, {'radius': 'nan'}, {'radius': 'far'}, {'type': 'hotel'}):
+            with self.subTest(**params):
+                self.assertEqual(self.nearest(**params).status_code, 400)
+        self.assertEqual(self.client.get('/api/places/nearest/', {'latitude': 14.6}).status_code, 400)
+
+    def test_nearest_first(self):
+        for enabled in (False, True):
+            with self.subTest(spatial_index=enabled), override_settings(PLACES_SPATIAL_INDEX_ENABLED=enabled):
+                result = self.nearest(k=3)
+                self.assertEqual(result.status_code, 200)
+                self.assertEqual([place['id'] for place in result.json()['rentals']], [rental.pk for rental in self.rentals[:3]])
+                self.assertEqual([place['id'] for place in result.json()['foods']], [self.food.pk])
+
+                # Only Rental 0 and 1 are within 1.5 km
+                result = self.nearest(k=3, radius=1.5, type='rental')
+                self.assertEqual([place['id'] for place in result.json()['rentals']], [rental.pk for rental in self.rentals[:2]])
+                self.assertNotIn('foods', result.json())
+
+
+@override_settings(PLACES_RESPONSE_CACHE_TIMEOUT=0)
+class PlaceSearchPaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        owner = create_profile('owner')
+        for i in range(3):
+            create_rental(owner, f'Rental {i}', latitude=14.6 + i * 0.001)
+        for i in range(2):
+            create_food_establishment(owner, f'Food {i}', latitude=14.6 + i * 0.001)
+        create_rental(owner, 'Far rental', latitude=15.6)
+
+    def setUp(self):
+        self.client = APIClient()
+        spatial_index.rebuild()
+
+    def search(self, **params):
+        result = self.client.get('/api/places/search/', {'latitude': 14.6, 'longitude': 121.0, 'radius': 3, 'page_size': 2, **params})
+        self.assertEqual(result.status_code, 200)
+        return result.json()
+
+    def test_lists_are_paginated_separately(self):
+        for enabled in (False, True):
+            with self.subTest(spatial_index=enabled), override_settings(PLACES_SPATIAL_INDEX_ENABLED=enabled):
+                first = self.search()
+                self.assertEqual(len(first['results']['rentals']), 2)
+                self.assertEqual(len(first['results']['foods']), 2)
+                self.assertEqual((first['meta']['rentals']['count'], first['meta']['foods']['count'], first['count']), (3, 2, 5))
+                self.assertIsNotNone(first['meta']['rentals']['next'])
+                self.assertIsNone(first['meta']['foods']['next'])
+                self.assertEqual(first['next'], first['meta']['rentals']['next'])
+
+                # The foods ran out on the first page, the last rental is still served
+                second = self.search(page=2)
+                self.assertEqual(len(second['results']['rentals']), 1)
+                self.assertEqual(second['results']['foods'], [])
+                self.assertIsNone(second['next'])
+                self.assertIsNotNone(second['previous'])
+                seen = {place['id'] for place in first['results']['rentals'] + second['results']['rentals']}
+                self.assertEqual(seen, set(Rental.objects.filter(latitude__lt=15).values_list('id', flat=True)))
+
+    def test_page_past_the_end(self):
+        for enabled in (False, True):
+            with self.subTest(spatial_index=enabled), override_settings(PLACES_SPATIAL_INDEX_ENABLED=enabled):
+                data = self.search(page=5)
+                self.assertEqual(data['results'], {'rentals': [], 'foods': []})
+                self.assertEqual(data['meta']['rentals']['count'], 3)
+                self.assertEqual(data['meta']['foods']['count'], 2)
+                self.assertEqual(data['count'], data['meta']['rentals']['count'] + data['meta']['foods']['count'])
+                self.assertIsNone(data['next'])
+
+
+class MapIconSpriteTests(TestCase):
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+        owner = create_profile('owner')
+        self.rentals = [create_rental(owner, f'Rental {i}') for i in range(2)]
+        for rental, color in zip(self.rentals, ((255, 0, 0, 255), (0, 0, 255, 255))):
+            image = io.BytesIO()
+            Image.new('RGBA', (16, 16), color).save(image, 'PNG')
+            rental.map_icon.save('icon.png', ContentFile(image.getvalue()), save=True)
+        self.client = APIClient()
+
+    def test_index_not_modified(self):
+        result = self.client.get('/api/places/map-icons/')
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(len(result.json()['icons']), 2)
+        etag = result['ETag']
+        for header in (etag, f'W/{etag}', f'"stale", {etag}', '*'):
+            with self.subTest(if_none_match=header):
+                result = self.client.get('/api/places/map-icons/', HTTP_IF_NONE_MATCH=header)
+                self.assertEqual(result.status_code, 304)
+                self.assertEqual(result['ETag'], etag)
+        self.assertEqual(self.client.get('/api/places/map-icons/', HTTP_IF_NONE_MATCH='"stale"').status_code, 200)
+
+    def test_sprite_not_modified(self):
+        sprite_hash = self.client.get('/api/places/map-icons/').json()['hash']
+        url = f'/api/places/map-icons/{sprite_hash}.png'
+        result = self.client.get(url)
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(result['Content-Type'], 'image/png')
+        self.assertIn('immutable', result['Cache-Control'])
+
+        result = self.client.get(url, HTTP_IF_NONE_MATCH=f'W/{result["ETag"]}')
+        self.assertEqual(result.status_code, 304)
+        self.assertIn('immutable', result['Cache-Control'])
+        self.assertEqual(self.client.get('/api/places/map-icons/0000000000000000.png').status_code, 404)
+
+    def test_changed_icon_replaces_the_sprite(self):
+        before = self.client.get('/api/places/map-icons/')
+        image = io.BytesIO()
+        Image.new('RGBA', (24, 24), (0, 255, 0, 255)).save(image, 'PNG')
+        self.rentals[0].map_icon.save('icon.png', ContentFile(image.getvalue()), save=True)
+
+        result = self.client.get('/api/places/map-icons/', HTTP_IF_NONE_MATCH=before['ETag'])
+        self.assertEqual(result.status_code, 200)
+        self.assertNotEqual(result.json()['hash'], before.json()['hash'])
+        self.assertEqual(self.client.get(f'/api/places/map-icons/{before.json()["hash"]}.png').status_code, 404)
+
+
+@override_settings(PLACES_RESPONSE_CACHE_TIMEOUT=60, PLACES_RESPONSE_CACHE_GRID=0.001)
+class AnonymousResponseCacheTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = create_profile('owner')
+        create_rental(cls.owner, 'Green Dorm')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def search(self, latitude, longitude):
+        return self.client.get('/api/places/search/', {'latitude': latitude, 'longitude': longitude, 'radius': 5})
+
+    def test_snap_coordinate(self):
+        self.assertEqual(snap_coordinate('14.60012', 0.001), '14.600000')
+        self.assertEqual(snap_coordinate('14.60049', 0.001), snap_coordinate('14.59951', 0.001))
+        self.assertEqual(snap_coordinate('-121.0004', 0.001), '-121.000000')
+        self.assertEqual(snap_coordinate('north', 0.001), 'north')
+
+    def test_nearby_coordinates_share_an_entry(self):
+        first = self.search('14.60012', '121.00031')
+        self.assertEqual(first['X-Cache'], 'MISS')
+        second = self.search('14.59988', '120.99972')
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(second.json(), first.json())
+
+        # A different grid cell is a different entry
+        self.assertEqual(self.search('14.602', '121.0')['X-Cache'], 'MISS')
+
+    def test_catalog_change_and_authenticated_users_skip_the_entry(self):
+        self.assertEqual(self.search('14.6', '121.0')['X-Cache'], 'MISS')
+        create_rental(self.owner, 'Blue House')
+        result = self.search('14.6', '121.0')
+        self.assertEqual(result['X-Cache'], 'MISS')
+        self.assertEqual(result.json()['meta']['rentals']['count'], 2)
+
+        self.client.force_authenticate(self.owner.user)
+        self.assertFalse(self.search('14.6', '121.0').has_header('X-Cache'))
@@ -1,21 +1,106 @@
 import math
 
+import numpy as np
+from django.db.models import FloatField, Q
+from django.db.models.functions import ASin, Cos, Power, Radians, Sin, Sqrt
+
+EARTH_RADIUS_KM = 6371  # Radius of the Earth in km
+
+
 class DistanceMixin:
     def haversine(self, lon1, lat1, lon2, lat2):
         """
         Calculate the great-circle distance between two points
         on the Earth specified in decimal degrees (latitude and longitude).
-        
+
         :param lon1: Longitude of the first point
         :param lat1: Latitude of the first point
         :param lon2: Longitude of the second point
         :param lat2: Latitude of the second point
         :return: Distance between the two points in kilometers
         """
-        R = 6371  # Radius of the Earth in km
-        dlon = lon2 - lon1
-        dlat = lat2 - lat1
+        dlon = math.radians(lon2 - lon1)
+        dlat = math.radians(lat2 - lat1)
         a = math.sin(dlat / 2)**2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon / 2)**2
-        c = 2 * math.asin(math.sqrt(a))
-        value = R * c
+        c = 2 * math.asin(min(1.0, math.sqrt(a)))
+        value = EARTH_RADIUS_KM * c
         return value  # Distance in km
+
+    def haversine_many(self, lon, lat, lons, lats, radius=None):
+        """
+        Vectorized haversine from one point to arrays of points.
+
+        :param lon: Longitude of the origin
+        :param lat: Latitude of the origin
+        :param lons: Array-like of longitudes
+        :param lats: Array-like of latitudes
+        :param radius: Optional radius in km for the mask
+        :return: (distances, mask) arrays; mask marks the points within `radius` km
+        """
+        lons = np.radians(np.asarray(lons, dtype=np.float64))
+        lats = np.radians(np.asarray(lats, dtype=np.float64))
+        lat1 = math.radians(lat)
+        a = np.sin((lats - lat1) / 2)**2 + math.cos(lat1) * np.cos(lats) * np.sin((lons - math.radians(lon)) / 2)**2
+        distances = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+        if radius is None:
+            mask = np.ones(distances.shape, dtype=bool)
+        else:
+            mask = distances <= radius
+        return distances, mask
+
+    def bounding_box(self, latitude, longitude, radius):
+        """
+        Return the (min_lat, max_lat, min_lon, max_lon) box that encloses a circle
+        of `radius` km around the given point. The longitude bounds are None when the
+        box reaches a pole or spans the whole globe, since they can't narrow anything then.
+        """
+        delta_lat = math.degrees(radius / EARTH_RADIUS_KM)
+        min_lat = max(latitude - delta_lat, -90.0)
+        max_lat = min(latitude + delta_lat, 90.0)
+
+        if min_lat <= -90.0 or max_lat >= 90.0:
+            return min_lat, max_lat, None, None
+
+        delta_lon = math.degrees(math.asin(min(1.0, math.sin(radius / EARTH_RADIUS_KM) / math.cos(math.radians(latitude)))))
+        if delta_lon >= 180.0:
+            return min_lat, max_lat, None, None
+
+        return min_lat, max_lat, longitude - delta_lon, longitude + delta_lon
+
+    def distance_expression(self, latitude, longitude):
+        """
+        Build a database expression computing the haversine distance (in km) between
+        the given point and the `latitude`/`longitude` columns of each row.
+        """
+        dlat = Radians('latitude') - math.radians(latitude)
+        dlon = Radians('longitude') - math.radians(longitude)
+        a = (
+            Power(Sin(dlat / 2), 2)
+            + math.cos(math.radians(latitude)) * Cos(Radians('latitude')) * Power(Sin(dlon / 2), 2)
+        )
+        return ASin(Sqrt(a), output_field=FloatField()) * (2 * EARTH_RADIUS_KM)
+
+    def filter_by_distance(self, queryset, latitude, longitude, radius):
+        """
+        Narrow the queryset to rows within `radius` km of the given point.
+
+        Rows are first cut down with an indexable bounding box on latitude/longitude, then
+        the exact great-circle distance is annotated as `distance` and filtered in SQL, so
+        the result is still a lazy QuerySet that can be ordered and paginated.
+        """
+        min_lat, max_lat, min_lon, max_lon = self.bounding_box(latitude, longitude, radius)
+
+        queryset = queryset.filter(latitude__gte=min_lat, latitude__lte=max_lat)
+        if min_lon is not None:
+            if min_lon < -180.0 or max_lon > 180.0:
+                # The box crosses the antimeridian, so split it into two ranges
+                queryset = queryset.filter(
+                    Q(longitude__gte=(min_lon + 540.0) % 360.0 - 180.0) |
+                    Q(longitude__lte=(max_lon + 540.0) % 360.0 - 180.0)
+                )
+            else:
+                queryset = queryset.filter(longitude__gte=min_lon, longitude__lte=max_lon)
+
+        return queryset.annotate(
+            distance=self.distance_expression(latitude, longitude)
+        ).filter(distance__lte=radius)
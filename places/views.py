@@ -1,64 +1,139 @@
+import hashlib
+
 from rest_framework.views import APIView
 from rest_framework import permissions, response, status, viewsets
-from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.generics import ListAPIView, RetrieveUpdateAPIView
+from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
-
-from core.paginate import ExtraSmallResultsSetPagination
+from django.db import transaction
+from django.db.models import Count, F, Max, Q
+from django.http import HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date, parse_etags
+
+from core.paginate import CursorPaginationMixin, ExtraSmallResultsSetPagination
 from .models import Category, Rental, FoodEstablishment, Review, RentalFavorite, FoodEstablishmentFavorite
 from .serializers import RentalSerializer, FoodEstablishmentSerializer, CategorySerializer, ReviewSerializer, RentalFavoriteSerializer
-import math
 from .utils import DistanceMixin
+from .search import search_places
+from .cache import cache_anonymous_response, get_category_tree
+from .suggest import suggestion_index
+from .sprites import get_sprite
+from .spatial_index import FOOD, RENTAL, spatial_index, spatial_index_enabled
+from .export import CONTENT_TYPES, iter_export
+
+
+def etag_matches(request, etag):
+    """ Weak comparison of `etag` against If-None-Match, which may be a list or `*`. """
+    header = request.META.get('HTTP_IF_NONE_MATCH', '')
+    if header.strip() == '*':
+        return True
+    return any(candidate.removeprefix('W/') == etag for candidate in parse_etags(header))
+
 
 class CategoryListView(ListAPIView):
     permission_classes = [permissions.AllowAny]
     serializer_class = CategorySerializer
 
     def get_queryset(self):
-        queryset = Category.objects.filter(parent__isnull=True).prefetch_related('subcategories')
-        
+        return Category.objects.filter(parent__isnull=True).prefetch_related('subcategories')
+
+    def list(self, request, *args, **kwargs):
+        # The serialized tree is cached and invalidated by Category signals
+        categories = get_category_tree()
+
         # Get the 'q' query parameter from the request
         query = self.request.GET.get('q', None)
-        
-        # If a query parameter is provided, filter the queryset
+
+        # If a query parameter is provided, filter the cached tree in memory, prefix matches first
         if query:
-            queryset = queryset.filter(name__icontains=query)  # Use icontains for case-insensitive search
+            query = query.casefold()
+            categories = [category for category in categories if query in category['name'].casefold()]
+            categories.sort(key=lambda category: not category['name'].casefold().startswith(query))
 
-        return queryset
+        page = self.paginate_queryset(categories)
+        if page is not None:
+            return self.get_paginated_response(page)
+        return response.Response(categories)
 
 class PlaceSearchView(APIView, DistanceMixin):
     permission_classes = [permissions.AllowAny]
     pagination_class = ExtraSmallResultsSetPagination
 
-    def get_full_category_hierarchy(self, category_id):
-        """Recursively get all descendant and ancestor categories for a given category."""
+    def get_full_category_hierarchy(self, category_ids):
+        """Get the IDs of every category under the root categories of the given ones, in one query."""
+        return Category.hierarchy_ids(category_ids)
+
+    def spatial_candidates(self, kind, latitude, longitude, radius):
+        """
+        (distance, id) pairs within the radius from the in-memory grid, nearest first, or
+        None when the index is disabled or the radius is too wide for it to narrow anything.
+        """
+        if not spatial_index_enabled() or radius > getattr(settings, 'PLACES_SPATIAL_INDEX_MAX_RADIUS', 50):
+            return None
+        candidates = spatial_index.within_radius(latitude, longitude, radius, kind=kind)
+        return sorted((distance, pk) for pk, distance in candidates.items())
+
+    def filter_within_radius(self, queryset, kind, latitude, longitude, radius, filtered):
+        """
+        Places within the radius. Without text or category filters the index's candidates
+        are returned as a list, paginated in memory and loaded a page at a time with in_bulk.
+        Otherwise a short enough candidate list narrows the queryset, and anything else
+        falls back to the bounding-box query.
+        """
+        candidates = self.spatial_candidates(kind, latitude, longitude, radius)
+        if candidates is not None and not filtered:
+            return candidates
+        if candidates is not None and len(candidates) <= getattr(settings, 'PLACES_SPATIAL_INDEX_MAX_CANDIDATES', 1000):
+            return queryset.filter(pk__in=[pk for _, pk in candidates]).annotate(
+                distance=self.distance_expression(latitude, longitude)
+            )
+        return self.filter_by_distance(queryset, latitude, longitude, radius)
+
+    def paginate_results(self, results, request, model):
+        """
+        Paginate one result set on its own, returning the page of objects and its
+        count/next/previous metadata. A page past the end of this list (the other one
+        may still have items) yields an empty page instead of a 404. `results` is a
+        queryset, or a list of (distance, id) candidates from the spatial index whose
+        page is loaded with in_bulk.
+        """
+        paginator = self.pagination_class()
         try:
-            category = Category.objects.get(id=category_id)
-        except Category.DoesNotExist:
-            return []  # If the category does not exist, return an empty list
-
-        related_categories = {category}  # Use a set to avoid duplicates
-
-        # Add all ancestor categories
-        while category.parent:
-            category = category.parent
-            related_categories.add(category)
-
-        # Add all descendant categories
-        def add_descendants(cat):
-            for child in cat.subcategories.all():  # Use the related_name to get subcategories
-                related_categories.add(child)
-                add_descendants(child)
-
-        add_descendants(category)
-        
-        return list(related_categories)
+            page = paginator.paginate_queryset(results, request, view=self)
+        except NotFound:
+            count = len(results) if isinstance(results, list) else results.count()
+            return [], {'count': count, 'next': None, 'previous': None}
+
+        if isinstance(results, list):
+            objects = model.objects.in_bulk([pk for _, pk in page])
+            candidates, page = page, []
+            for distance, pk in candidates:
+                if pk in objects:  # Deleted since the index last saw it
+                    objects[pk].distance = distance
+                    page.append(objects[pk])
+        return page, {
+            'count': paginator.page.paginator.count,
+            'next': paginator.get_next_link(),
+            'previous': paginator.get_previous_link(),
+        }
 
+    @cache_anonymous_response
     def get(self, request, *args, **kwargs):
         query = request.GET.get('q', '')
         latitude = request.GET.get('latitude')
         longitude = request.GET.get('longitude')
-        radius = 10000  # Radius in km
+        radius = request.GET.get('radius')
+        # An explicit radius is a "what's near me" search, so it lists the nearest places first
+        order_by_distance = bool(radius)
+        try:
+            radius = float(radius) if radius else 10000  # Radius in km
+        except ValueError:
+            return response.Response({'error': 'Invalid radius.'}, status=status.HTTP_400_BAD_REQUEST)
+        if not radius > 0:  # Also rejects nan
+            return response.Response({'error': 'Invalid radius.'}, status=status.HTTP_400_BAD_REQUEST)
 
         # Retrieve and parse the comma-separated list of category IDs
         category_list = request.GET.get('category_list', '')
@@ -75,82 +150,231 @@ class PlaceSearchView(APIView, DistanceMixin):
 
         # Apply search filtering
         if query:
-            rental_results = rental_results.filter(
-                Q(name__icontains=query) | Q(description__icontains=query) | Q(address__icontains=query)
-            )
-            food_establishment_results = food_establishment_results.filter(
-                Q(name__icontains=query) | Q(description__icontains=query) | Q(address__icontains=query)
-            )
+            rental_results = search_places(rental_results, query)
+            food_establishment_results = search_places(food_establishment_results, query)
 
         # Filter by category list if provided
         if category_ids:
-            # Get the full hierarchy for each category in category_ids
-            categories_to_include = set()  # Using a set to avoid duplicates
-            for category_id in category_ids:
-                categories_to_include.update(self.get_full_category_hierarchy(category_id))
+            # Get the whole category tree of every category in category_ids from the closure table
+            categories_to_include = self.get_full_category_hierarchy(category_ids)
 
             # Filter rentals and food establishments by the combined list of categories
-            rental_results = rental_results.filter(categories__in=categories_to_include)
-            food_establishment_results = food_establishment_results.filter(categories__in=categories_to_include)
+            # distinct() so a place in several matching categories is only counted once
+            rental_results = rental_results.filter(categories__in=categories_to_include).distinct()
+            food_establishment_results = food_establishment_results.filter(categories__in=categories_to_include).distinct()
 
-        # Initialize lists for filtered results
+        # Initialize querysets for filtered results
+        located = False
         rental_within_radius = rental_results
-        food_within_radius = []
+        food_within_radius = food_establishment_results
 
-        # If latitude and longitude are provided, filter by distance
+        # If latitude and longitude are provided, keep the places within the radius
         if latitude and longitude:
-            latitude = float(latitude)
-            longitude = float(longitude)
-
-            rental_within_radius = [
-                rental for rental in rental_results
-                if self.haversine(longitude, latitude, rental.longitude, rental.latitude) <= radius
-            ]
-
-            food_within_radius = [
-                food for food in food_establishment_results
-                if self.haversine(longitude, latitude, food.longitude, food.latitude) <= radius
-            ]
-        else:
-            food_within_radius = food_establishment_results
+            try:
+                latitude = float(latitude)
+                longitude = float(longitude)
+            except ValueError:
+                return response.Response({'error': 'Invalid coordinates'}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Serialize the results for rentals and foods separately
-        serialized_rentals = RentalSerializer(rental_within_radius, many=True, context={'request': request}).data
-        serialized_foods = FoodEstablishmentSerializer(food_within_radius, many=True, context={'request': request}).data
+            located = True
+            filtered = bool(query or category_ids)
+            rental_within_radius = self.filter_within_radius(rental_results, RENTAL, latitude, longitude, radius, filtered)
+            food_within_radius = self.filter_within_radius(food_establishment_results, FOOD, latitude, longitude, radius, filtered)
+
+        if request.GET.get('ordering') == 'relevance' and query:
+            rental_within_radius = rental_within_radius.order_by('-search_rank', 'id')
+            food_within_radius = food_within_radius.order_by('-search_rank', 'id')
+        elif order_by_distance and located:
+            if not isinstance(rental_within_radius, list):
+                rental_within_radius = rental_within_radius.order_by('distance', 'id')
+            if not isinstance(food_within_radius, list):
+                food_within_radius = food_within_radius.order_by('distance', 'id')
+
+        # Paginate rentals and foods separately, then serialize only the requested page of each
+        paginated_rentals, rental_meta = self.paginate_results(rental_within_radius, request, Rental)
+        paginated_foods, food_meta = self.paginate_results(food_within_radius, request, FoodEstablishment)
+
+        serialized_rentals = RentalSerializer(paginated_rentals, many=True, context={'request': request}).data
+        serialized_foods = FoodEstablishmentSerializer(paginated_foods, many=True, context={'request': request}).data
+
+        # Combine the results into a structured response. The top-level count is the total of
+        # both lists, and next/previous link to a page on which either list still has items.
+        return response.Response({
+            'count': rental_meta['count'] + food_meta['count'],
+            'next': rental_meta['next'] or food_meta['next'],
+            'previous': rental_meta['previous'] or food_meta['previous'],
+            'meta': {
+                'rentals': rental_meta,
+                'foods': food_meta,
+            },
+            'results': {
+                'rentals': serialized_rentals,
+                'foods': serialized_foods
+            },
+        })
+
+
+class PlaceSuggestView(APIView):
+    """ Typeahead suggestions for the search box, served from the in-memory prefix index. """
+    permission_classes = [permissions.AllowAny]
+    authentication_classes = []  # Suggestions are public, skip token lookups on every keystroke
+    default_limit = 10
+    max_limit = 20
 
-        # Paginate rentals and foods separately
-        paginator = self.pagination_class()
-        paginated_rentals = paginator.paginate_queryset(serialized_rentals, request)
-        paginated_foods = paginator.paginate_queryset(serialized_foods, request)
+    def get(self, request, *args, **kwargs):
+        query = request.GET.get('q', '')
+        try:
+            limit = max(1, min(int(request.GET.get('limit', self.default_limit)), self.max_limit))
+        except ValueError:
+            return response.Response({'error': 'Invalid limit.'}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Combine the results into a structured response
-        results = {
-            'rentals': paginated_rentals,
-            'foods': paginated_foods
-        }
+        return response.Response({'results': suggestion_index.suggest(query, limit)})
+
+
+class MapIconSpriteIndexView(APIView):
+    """
+    Offsets of every map icon in the sprite sheet. Places carry a `map_icon_key` into
+    `icons`, so with ?map_icon_format=sprite search results skip the inline base64 icon.
+    """
+    permission_classes = [permissions.AllowAny]
+    authentication_classes = []
+
+    def get(self, request, *args, **kwargs):
+        sprite = get_sprite()
+        etag = f'"{sprite["index_hash"]}"'
+        if etag_matches(request, etag):
+            return HttpResponseNotModified(headers={'ETag': etag})
+
+        result = response.Response({
+            'hash': sprite['hash'],
+            'sprite_url': request.build_absolute_uri(reverse('api:map-icon-sprite', args=[sprite['hash']])),
+            'icons': sprite['icons'],
+            'buildings': sprite['buildings'],
+        })
+        # The index changes whenever an icon does, so clients revalidate it with the ETag
+        result['ETag'] = etag
+        result['Cache-Control'] = 'public, no-cache'
+        return result
+
+
+class MapIconSpriteView(APIView):
+    """ The sprite sheet PNG, addressed by its content hash so it can be cached forever. """
+    permission_classes = [permissions.AllowAny]
+    authentication_classes = []
 
-        return paginator.get_paginated_response(results)
+    def get(self, request, sprite_hash, *args, **kwargs):
+        sprite = get_sprite()
+        if sprite_hash != sprite['hash']:
+            raise NotFound('Sprite sheet has been replaced, reload the map icon index.')
 
+        etag = f'"{sprite["hash"]}"'
+        headers = {'ETag': etag, 'Cache-Control': 'public, max-age=31536000, immutable'}
+        if etag_matches(request, etag):
+            return HttpResponseNotModified(headers=headers)
+        return HttpResponse(sprite['png'], content_type='image/png', headers=headers)
 
 
+class NearestPlacesView(APIView, DistanceMixin):
+    """ Return the k rentals and food establishments closest to a point, nearest first. """
+    permission_classes = [permissions.AllowAny]
+    default_k = 20
+    max_k = 100
+
+    def get_nearest(self, model, kind, latitude, longitude, k, radius):
+        if spatial_index_enabled():
+            # Top-k is selected from the in-memory grid with a bounded heap
+            nearest = spatial_index.nearest(latitude, longitude, k, kind=kind, max_radius=radius)
+            objects = model.objects.in_bulk([pk for _, pk in nearest])
+            results = []
+            for distance, pk in nearest:
+                obj = objects.get(pk)
+                if obj is not None:
+                    obj.distance = distance
+                    results.append(obj)
+            return results
+
+        queryset = model.objects.all()
+        if radius is not None:
+            queryset = self.filter_by_distance(queryset, latitude, longitude, radius)
+        else:
+            queryset = queryset.annotate(distance=self.distance_expression(latitude, longitude))
+        # ORDER BY ... LIMIT lets the database run a top-N sort instead of sorting every row
+        return queryset.order_by('distance', 'id')[:k]
+
+    def get(self, request, *args, **kwargs):
+        place_type = request.GET.get('type')
+        try:
+            latitude = float(request.GET['latitude'])
+            longitude = float(request.GET['longitude'])
+        except (KeyError, ValueError):
+            return response.Response({'error': 'Valid latitude and longitude are required.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            k = min(int(request.GET.get('k', self.default_k)), self.max_k)
+            radius = request.GET.get('radius')
+            radius = float(radius) if radius else None
+        except ValueError:
+            return response.Response({'error': 'Invalid k or radius.'}, status=status.HTTP_400_BAD_REQUEST)
+        if k < 1 or (radius is not None and not radius > 0):
+            return response.Response({'error': 'k and radius must be positive.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        if place_type not in (None, RENTAL, FOOD):
+            return response.Response({'error': 'Invalid type. Use "rental" or "food".'}, status=status.HTTP_400_BAD_REQUEST)
+
+        results = {}
+        if place_type in (None, RENTAL):
+            rentals = self.get_nearest(Rental, RENTAL, latitude, longitude, k, radius)
+            results['rentals'] = RentalSerializer(rentals, many=True, context={'request': request}).data
+        if place_type in (None, FOOD):
+            foods = self.get_nearest(FoodEstablishment, FOOD, latitude, longitude, k, radius)
+            results['foods'] = FoodEstablishmentSerializer(foods, many=True, context={'request': request}).data
+
+        return response.Response(results)
+
+
+class PlaceExportView(APIView):
+    """
+    The whole catalog as NDJSON (places/export.ndjson) or a GeoJSON FeatureCollection
+    (places/export.geojson), streamed from a database cursor instead of paged.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, export_format, *args, **kwargs):
+        if export_format not in CONTENT_TYPES:
+            raise NotFound('Unknown export format. Use "ndjson" or "geojson".')
+        place_type = request.GET.get('type')
+        if place_type not in (None, RENTAL, FOOD):
+            return response.Response({'error': 'Invalid type. Use "rental" or "food".'}, status=status.HTTP_400_BAD_REQUEST)
+
+        kinds = [place_type] if place_type else None
+        result = StreamingHttpResponse(
+            iter_export(export_format, kinds, absolute_url=request.build_absolute_uri),
+            content_type=CONTENT_TYPES[export_format],
+        )
+        result['Content-Disposition'] = f'attachment; filename="places.{export_format}"'
+        return result
 
 
-class BaseSearchView(ListAPIView, DistanceMixin):
+class BaseSearchView(CursorPaginationMixin, ListAPIView, DistanceMixin):
     permission_classes = [permissions.AllowAny]
     query_param = 'q'
     category_param = 'category_id'
     latitude_param = 'latitude'
     longitude_param = 'longitude'
     radius_param = 'radius'
+    ordering_param = 'ordering'
     is_featured = 'is_featured'
 
+    @cache_anonymous_response
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
     def get_parent_categories(self, category_id):
-        """ Recursively get parent categories. """
-        category = self.get_category_model().objects.get(id=category_id)
-        parent_categories = [category]
-        while category.parent:
-            category = category.parent
-            parent_categories.append(category)
+        """ Get the IDs of the category and its parent categories from the closure table. """
+        category_model = self.get_category_model()
+        parent_categories = category_model.ancestor_ids(int(category_id))
+        if not parent_categories:
+            raise category_model.DoesNotExist
         return parent_categories
 
     def filter_queryset(self, queryset):
@@ -166,17 +390,15 @@ class BaseSearchView(ListAPIView, DistanceMixin):
         
         # Apply search filtering
         if query:
-            queryset = queryset.filter(
-                Q(name__icontains=query) | Q(description__icontains=query) | Q(address__icontains=query)
-            )
+            queryset = search_places(queryset, query)
 
         # Filter by category if provided
         if category_id:
             try:
                 parent_categories = self.get_parent_categories(category_id)
                 queryset = queryset.filter(categories__in=parent_categories)
-            except self.get_category_model().DoesNotExist:
-                return response.Response({'error': 'Invalid category ID'}, status=status.HTTP_400_BAD_REQUEST)
+            except (ValueError, self.get_category_model().DoesNotExist):
+                raise ValidationError({'error': 'Invalid category ID'})
 
         # Filter by distance if latitude and longitude are provided
         if latitude and longitude:
@@ -184,19 +406,34 @@ class BaseSearchView(ListAPIView, DistanceMixin):
                 latitude = float(latitude)
                 longitude = float(longitude)
                 radius = float(radius)
-
-                # Filter queryset by calculating the distance between user location and object location
-                queryset = [
-                    obj for obj in queryset
-                    if self.haversine(longitude, latitude, obj.longitude, obj.latitude) <= radius
-                ]
             except ValueError:
-                return response.Response({'error': 'Invalid coordinates'}, status=status.HTTP_400_BAD_REQUEST)
+                raise ValidationError({'error': 'Invalid coordinates'})
+
+            # Bounding box + haversine annotation, evaluated by the database
+            queryset = self.filter_by_distance(queryset, latitude, longitude, radius)
+
+        ordering = self.request.GET.get(self.ordering_param)
+        if ordering in ('distance', 'relevance', 'best_reviewed') and self.use_cursor_pagination():
+            raise ValidationError({'error': f'Ordering by {ordering} is not supported with cursor pagination'})
+
+        # Closest first; with the page LIMIT the database only keeps the top rows
+        if ordering == 'distance':
+            if not (latitude and longitude):
+                raise ValidationError({'error': 'Ordering by distance requires latitude and longitude'})
+            queryset = queryset.order_by('distance', 'id')
+        elif ordering == 'relevance':
+            if not query:
+                raise ValidationError({'error': 'Ordering by relevance requires a search query'})
+            queryset = queryset.order_by('-search_rank', 'id')
+        elif ordering == 'best_reviewed':
+            # Uses the review stats stored on Building, no join on reviews
+            queryset = queryset.order_by(F('avg_sentiment').desc(nulls_last=True), '-review_count', 'id')
 
         return queryset
 
     def get_queryset(self):
-        return self.filter_queryset(self.queryset)
+        # ListAPIView.list() runs filter_queryset() on this, so return the base queryset only
+        return self.queryset.all()
 
     def get_category_model(self):
         raise NotImplementedError("You should implement get_category_model in the subclass.")
@@ -232,7 +469,63 @@ class BaseRetrieveUpdateView(RetrieveUpdateAPIView):
     lookup_field = 'id'  # Assuming you're looking up by the 'id' field, adjust if necessary
     
     def get_queryset(self):
-        return self.queryset
+        return self.queryset.select_related('user_profile')
+
+    def get_validators(self, instance):
+        """
+        Return the (ETag, Last-Modified) of the detail response for this request. Everything
+        the serializer renders is summed up with a few small aggregate queries: the place's
+        row and stored review stats, its photos, its reviews, its categories and their
+        subcategories, the requesting user's favorite and review, and the query parameters.
+        """
+        request = self.request
+        content_type = ContentType.objects.get_for_model(instance)
+        photos = instance.photos.aggregate(count=Count('id'), changed=Max('updated_at'))
+        reviews = Review.objects.filter(content_type=content_type, object_id=instance.pk).aggregate(changed=Max('updated_at'))
+        category_ids = sorted(instance.categories.values_list('id', flat=True))
+        categories = Category.objects.filter(Q(id__in=category_ids) | Q(parent_id__in=category_ids)).aggregate(
+            count=Count('id'), changed=Max('updated_at'),
+        )
+
+        user_state = None
+        changes = [instance.updated_at, instance.user_profile.updated_at, photos['changed'], reviews['changed'], categories['changed']]
+        if request.user.is_authenticated:
+            profile = request.user.profile
+            favorited = instance.favorited_by.filter(user_profile=profile).values_list('created_at', flat=True).first()
+            user_review = Review.objects.filter(
+                content_type=content_type, object_id=instance.pk, user_profile=profile,
+            ).values_list('id', 'updated_at', 'sentiment_label', 'sentiment_score').first()
+            user_state = (profile.pk, favorited, user_review)
+            changes += [favorited, user_review[1] if user_review else None]
+
+        validator = repr((
+            instance.pk, instance.updated_at, instance.map_icon.name, instance.user_profile.updated_at,
+            instance.review_count, instance.sentiment_count, instance.sentiment_sum,
+            photos, reviews, category_ids, categories, user_state,
+            sorted(request.GET.lists()), request.accepted_media_type,
+        ))
+        etag = f'"{hashlib.sha1(validator.encode()).hexdigest()}"'
+        return etag, max(change for change in changes if change is not None)
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        etag, last_modified = self.get_validators(instance)
+        headers = {
+            'ETag': etag,
+            'Last-Modified': http_date(last_modified.timestamp()),
+            # Per-user fields: browsers may keep it but must revalidate, shared caches must not store it
+            'Cache-Control': 'private, no-cache',
+        }
+
+        # Nothing changed since the client's copy, skip the serializer entirely
+        if etag_matches(request, etag):
+            result = response.Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        else:
+            serializer = self.get_serializer(instance)
+            result = response.Response(serializer.data, headers=headers)
+        # The favorite/review fields differ per user, whether signed in by token or session
+        patch_vary_headers(result, ['Authorization', 'Cookie'])
+        return result
 
     def get_category_model(self):
         raise NotImplementedError("You should implement get_category_model in the subclass.")
@@ -295,7 +588,7 @@ class FoodEstablishmentRetrieveUpdateView(BaseRetrieveUpdateView):
     def get_serializer_class(self):
         return FoodEstablishmentSerializer 
     
-class ReviewViewSet(viewsets.ModelViewSet):
+class ReviewViewSet(CursorPaginationMixin, viewsets.ModelViewSet):
     permission_classes = [permissions.AllowAny]
     queryset = Review.objects.all()
     serializer_class = ReviewSerializer
@@ -357,26 +650,36 @@ class ReviewViewSet(viewsets.ModelViewSet):
         else:
             return response.Response(serializer.data, status=status.HTTP_200_OK)  # Existing review updated
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.method in ('PUT', 'PATCH', 'DELETE'):
+            # The place's stats are adjusted by the difference to the review as loaded here, so
+            # keep concurrent edits and background scoring off the row until the change commits
+            queryset = queryset.select_for_update()
+        return queryset
+
     def update(self, request, *args, **kwargs):
         """ Update an existing review """
-        instance = self.get_object()
+        with transaction.atomic():
+            instance = self.get_object()
 
-        # Ensure that only the user who created the review can update it
-        if instance.user_profile != request.user.profile:
-            return Response({'error': 'You are not allowed to update this review.'}, status=status.HTTP_403_FORBIDDEN)
+            # Ensure that only the user who created the review can update it
+            if instance.user_profile != request.user.profile:
+                return response.Response({'error': 'You are not allowed to update this review.'}, status=status.HTTP_403_FORBIDDEN)
 
-        # Handle partial updates or full updates
-        partial = kwargs.pop('partial', False)
-        serializer = self.get_serializer(instance, data=request.data, partial=partial)
+            # Handle partial updates or full updates
+            partial = kwargs.pop('partial', False)
+            serializer = self.get_serializer(instance, data=request.data, partial=partial)
 
-        serializer.is_valid(raise_exception=True)
-        self.perform_update(serializer)
+            serializer.is_valid(raise_exception=True)
+            self.perform_update(serializer)
 
         return response.Response(serializer.data)
 
     def destroy(self, request, *args, **kwargs):
-        review = self.get_object()
-        review.delete()
+        with transaction.atomic():
+            review = self.get_object()
+            review.delete()
         return response.Response(status=status.HTTP_204_NO_CONTENT)
 
     def perform_update(self, serializer):
@@ -384,7 +687,7 @@ class ReviewViewSet(viewsets.ModelViewSet):
         serializer.save()
         
 
-class RentalFavoriteListView(ListAPIView):
+class RentalFavoriteListView(CursorPaginationMixin, ListAPIView):
     serializer_class = RentalSerializer
     permission_classes = [permissions.IsAuthenticated]  # Ensure only authenticated users can access this view
     pagination_class = ExtraSmallResultsSetPagination
@@ -0,0 +1,33 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import close_old_connections, transaction
+
+logger = logging.getLogger(__name__)
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+def get_executor(name, max_workers):
+    """ Process-wide thread pool for one kind of background job, created on first use. """
+    with _executors_lock:
+        if name not in _executors:
+            _executors[name] = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        return _executors[name]
+
+
+def run_job(function, *args):
+    try:
+        function(*args)
+    except Exception:
+        logger.exception('Background job %s%r failed', function.__name__, args)
+    finally:
+        # Worker threads get their own database connections, don't leave them open
+        close_old_connections()
+
+
+def submit_on_commit(name, max_workers, function, *args):
+    """ Run `function(*args)` on the named pool once the current transaction commits. """
+    transaction.on_commit(lambda: get_executor(name, max_workers).submit(run_job, function, *args))
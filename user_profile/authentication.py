@@ -0,0 +1,106 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils import timezone
+from oauth2_provider.contrib.rest_framework import OAuth2Authentication
+
+from .models import UserProfile
+
+
+class TokenCache:
+    """
+    Bounded per-process LRU of authenticated bearer tokens.
+
+    Maps a token to the user (with its profile) and AccessToken it resolved to, for at most
+    `ttl` seconds and never past the token's own expiry. The AccessToken, User and UserProfile
+    signals in user_profile.signals drop entries of revoked, refreshed or changed tokens and
+    users in this process; other worker processes pick such changes up within `ttl`.
+    """
+
+    def __init__(self, max_size=10000, ttl=60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # token -> (cached until, user, access token)
+
+    def get(self, token):
+        """ Return fresh copies of the cached (user, access token), or None. """
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            cached_until, user, access_token = entry
+            if cached_until < time.monotonic() or access_token.expires <= timezone.now():
+                del self._entries[token]
+                return None
+            self._entries.move_to_end(token)
+        return self._copy(user, access_token)
+
+    def set(self, token, user, access_token):
+        user, access_token = self._copy(user, access_token)
+        with self._lock:
+            self._entries[token] = (time.monotonic() + self.ttl, user, access_token)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def discard(self, token):
+        with self._lock:
+            self._entries.pop(token, None)
+
+    def discard_user(self, user_id):
+        with self._lock:
+            for token in [token for token, entry in self._entries.items() if entry[1].pk == user_id]:
+                del self._entries[token]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _copy(self, user, access_token):
+        # Requests get their own instances, so nothing they change leaks into the cache
+        profile = user._state.fields_cache.get('profile')
+        user = copy.copy(user)
+        if profile is not None:
+            profile = copy.copy(profile)
+            profile.user = user
+            user.profile = profile
+        access_token = copy.copy(access_token)
+        access_token.user = user
+        return user, access_token
+
+
+token_cache = TokenCache(
+    max_size=getattr(settings, 'OAUTH_TOKEN_CACHE_SIZE', 10000),
+    ttl=getattr(settings, 'OAUTH_TOKEN_CACHE_TTL', 60),
+)
+
+
+class CachedOAuth2Authentication(OAuth2Authentication):
+    """
+    OAuth2Authentication that remembers resolved bearer tokens in `token_cache`, so repeat
+    requests skip the AccessToken/User lookup and the `request.user.profile` query.
+    """
+
+    def authenticate(self, request):
+        header = request.META.get('HTTP_AUTHORIZATION', '')
+        scheme, _, token = header.partition(' ')
+        if scheme.lower() != 'bearer' or not token:
+            return super().authenticate(request)
+
+        cached = token_cache.get(token)
+        if cached is not None:
+            return cached
+
+        result = super().authenticate(request)
+        if result is not None:
+            user, access_token = result
+            # Load the profile now, views read request.user.profile on most requests
+            profile = UserProfile.objects.filter(user=user).first()
+            if profile is not None:
+                user.profile = profile
+            token_cache.set(token, user, access_token)
+        return result
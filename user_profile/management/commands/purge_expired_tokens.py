@@ -0,0 +1,62 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+from oauth2_provider.models import get_access_token_model, get_refresh_token_model
+from oauth2_provider.settings import oauth2_settings
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete expired OAuth access tokens and refresh tokens that can no longer be used, '
+        'in small batches so no transaction holds the token tables for long.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows deleted per transaction.')
+        parser.add_argument('--sleep', type=float, default=0.0, help='Seconds to pause between batches.')
+
+    def purge(self, model, query, batch_size, pause):
+        """ Delete the rows matching `query` one primary key batch at a time, returning the count. """
+        deleted = 0
+        while True:
+            ids = list(model.objects.filter(query).order_by('pk').values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                return deleted
+            model.objects.filter(pk__in=ids).delete()
+            deleted += len(ids)
+            if pause:
+                time.sleep(pause)
+
+    def handle(self, *args, **options):
+        batch_size = max(options['batch_size'], 1)
+        pause = options['sleep']
+        now = timezone.now()
+        start = time.perf_counter()
+
+        # Refresh tokens stay usable for REFRESH_TOKEN_EXPIRE_SECONDS after their access token
+        # expired or after they were revoked, like oauth2_provider's own cleartokens
+        refresh_deleted = 0
+        refresh_lifetime = oauth2_settings.REFRESH_TOKEN_EXPIRE_SECONDS
+        if refresh_lifetime:
+            if not isinstance(refresh_lifetime, timedelta):
+                refresh_lifetime = timedelta(seconds=refresh_lifetime)
+            refresh_expired_at = now - refresh_lifetime
+            refresh_deleted = self.purge(
+                get_refresh_token_model(),
+                Q(revoked__lt=refresh_expired_at) | Q(access_token__expires__lt=refresh_expired_at),
+                batch_size, pause,
+            )
+
+        access_deleted = self.purge(
+            get_access_token_model(), Q(refresh_token__isnull=True, expires__lt=now), batch_size, pause,
+        )
+
+        elapsed = time.perf_counter() - start
+        total = refresh_deleted + access_deleted
+        self.stdout.write(self.style.SUCCESS(
+            f'Deleted {access_deleted} access tokens and {refresh_deleted} refresh tokens in {elapsed:.2f}s '
+            f'({total / elapsed if elapsed else 0:.0f} rows/s)'
+        ))
@@ -0,0 +1,26 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from oauth2_provider.models import get_access_token_model
+
+from .authentication import token_cache
+from .models import UserProfile
+
+
+@receiver(post_save, sender=get_access_token_model())
+@receiver(post_delete, sender=get_access_token_model())
+def invalidate_cached_token(sender, instance, **kwargs):
+    # Revoking or refreshing deletes the access token, any other change may narrow it
+    token_cache.discard(instance.token)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user_tokens(sender, instance, **kwargs):
+    token_cache.discard_user(instance.pk)
+
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def invalidate_cached_profile_tokens(sender, instance, **kwargs):
+    token_cache.discard_user(instance.user_id)
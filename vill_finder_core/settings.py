@@ -2,7 +2,6 @@ from pathlib import Path
 import os
 from dotenv import load_dotenv
 import dj_database_url
-import nltk
 
 
 load_dotenv()
@@ -36,6 +35,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     
     'django_admin_geomap',
     'oauth2_provider',
@@ -106,9 +106,14 @@ OAUTH2_PROVIDER = {
     'ROTATE_REFRESH_TOKENS': True,
 }
 
+# Resolved bearer tokens are kept per process (see user_profile.authentication); a revoked
+# token is dropped at once in the process that revoked it and within the TTL everywhere else
+OAUTH_TOKEN_CACHE_SIZE = 10000
+OAUTH_TOKEN_CACHE_TTL = 60  # Seconds
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'oauth2_provider.contrib.rest_framework.OAuth2Authentication',
+        'user_profile.authentication.CachedOAuth2Authentication',
         'rest_framework.authentication.SessionAuthentication',
         'rest_framework.authentication.TokenAuthentication',
     ),
@@ -186,6 +191,50 @@ if not DEBUG:
     # Turn on WhiteNoise storage backend that takes care of compressing static files
     # and creating unique names for each version so they can safely be cached forever.
 
+# Optional per-process grid index used by places/search/ for radius queries
+PLACES_SPATIAL_INDEX_ENABLED = os.environ.get('PLACES_SPATIAL_INDEX_ENABLED', 'false').lower() == 'true'
+PLACES_SPATIAL_INDEX_CELL_SIZE = 0.05  # Cell size in degrees (~5.5 km)
+PLACES_SPATIAL_INDEX_MAX_AGE = 300  # Seconds before a worker reloads the index from the database
+# The index is only used for a radius (km) up to this, wider searches cover most of the catalog anyway.
+# With text or category filters its candidates go into an IN (...) list, up to this many of them.
+PLACES_SPATIAL_INDEX_MAX_RADIUS = 50
+PLACES_SPATIAL_INDEX_MAX_CANDIDATES = 1000
+
+# In-memory prefix index behind places/suggest/
+PLACES_SUGGEST_INDEX_MAX_AGE = 300  # Seconds before a worker reloads the index from the database
+
+# Seconds a cached category tree is kept, changes invalidate it earlier in the same cache
+PLACES_CATEGORY_TREE_TIMEOUT = 300
+
+# Seconds a built map icon sprite sheet is kept. It is keyed on the icons in the database,
+# so a changed icon is picked up by every worker regardless
+PLACES_MAP_ICON_SPRITE_TIMEOUT = 86400
+# Seconds between checks of the icons in the database. The worker that saved an icon sees
+# it at once, the others within this many seconds
+PLACES_MAP_ICON_FINGERPRINT_TIMEOUT = 30
+
+# Threads resizing uploaded building photos into thumbnail/detail/WebP renditions
+PLACES_RENDITION_WORKERS = 2
+
+# Review sentiment is scored by background threads after the write returns. Reviews still
+# pending RETRY_AFTER seconds after their last edit (their job died with a restarted worker)
+# are re-scored by a sweep each process runs on a request at most every SWEEP_INTERVAL seconds
+# (0 disables it). `manage.py rescore_reviews --missing-only` does the same in bulk.
+PLACES_SENTIMENT_ASYNC = os.environ.get('PLACES_SENTIMENT_ASYNC', 'true').lower() == 'true'
+PLACES_SENTIMENT_WORKERS = 1
+PLACES_SENTIMENT_RETRY_AFTER = 300
+PLACES_SENTIMENT_SWEEP_INTERVAL = 60
+
+# Anonymous places/search/, places/rental/ and places/food/ responses are cached for this
+# many seconds (0 disables it), with coordinates snapped to a grid of this many degrees (~110 m).
+# No CACHES are configured, so each worker process has its own local-memory cache; point
+# CACHES at a shared FileBasedCache to invalidate all workers at once.
+PLACES_RESPONSE_CACHE_TIMEOUT = 60
+PLACES_RESPONSE_CACHE_GRID = 0.001
+
+# Places read per database round trip by places/export.ndjson|geojson and `manage.py export_places`
+PLACES_EXPORT_CHUNK_SIZE = 500
+
 MEDIA_ROOT = '/var/media/'
 MEDIA_URL = '/media/'
 # Default primary key field type
@@ -194,8 +243,6 @@ MEDIA_URL = '/media/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 
-# Define the NLTK data directory relative to your Django project
-nltk_data_dir = os.path.join(BASE_DIR, 'nltk_data')
-
-# Add the custom NLTK data path
-nltk.data.path.append(nltk_data_dir)
\ No newline at end of file
+# Define the NLTK data directory relative to your Django project. It is added to
+# nltk.data.path when review scoring first imports NLTK (see places.sentiment)
+NLTK_DATA_DIR = os.path.join(BASE_DIR, 'nltk_data')
\ No newline at end of file
@@ -1,3 +1,4 @@
+import hashlib
 import json
 from django.http import HttpResponse, JsonResponse
 from django.shortcuts import redirect, render
@@ -6,7 +7,9 @@ from django.views.decorators.debug import sensitive_post_parameters
 from oauth2_provider.models import get_access_token_model, AccessToken, RefreshToken, get_application_model
 from oauth2_provider.signals import app_authorized
 from oauth2_provider.views.base import TokenView
+from django.core.cache import cache
 from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction
 from oauthlib.common import generate_token
 from datetime import timedelta
 from firebase_admin import auth
@@ -22,17 +25,56 @@ from django.contrib.auth.models import Permission
 from django.contrib.contenttypes.models import ContentType
 from places.models import FoodEstablishment, Rental, BuildingPhoto
 
+# Reused tokens must stay valid at least this long, so clients don't get one about to expire
+TOKEN_REUSE_MIN_LIFETIME = timedelta(minutes=5)
+
+
 # Your custom token verification function
 def verify_firebase_token(id_token):
+    """
+    Verify a Firebase ID token, caching the claims under a hash of the token until it expires,
+    so repeat logins with the same token skip the signature check. firebase_admin keeps
+    Google's public certs in its in-process HTTP cache between calls.
+    """
+    key = f'firebase:claims:{hashlib.sha256(id_token.encode()).hexdigest()}'
+    decoded_token = cache.get(key)
+    if decoded_token is not None and decoded_token['exp'] > time.time():
+        return decoded_token
+
     try:
         # Directly verify the Firebase ID token
         decoded_token = auth.verify_id_token(id_token)
-        return decoded_token  # Token is valid
     except auth.InvalidIdTokenError:
         raise ValueError("Invalid token")
     except auth.ExpiredIdTokenError:
         raise ValueError("Token expired")
 
+    timeout = int(decoded_token['exp'] - time.time())
+    if timeout > 0:
+        cache.set(key, decoded_token, timeout=timeout)
+    return decoded_token  # Token is valid
+
+
+def get_reusable_tokens(user, application):
+    """
+    Return the (access token, refresh token) of the user's latest login to this application
+    if the access token is valid for at least TOKEN_REUSE_MIN_LIFETIME more and its refresh
+    token wasn't revoked, otherwise (None, None).
+    """
+    access_token = (
+        AccessToken.objects.select_related('refresh_token')
+        .filter(
+            user=user, application=application, scope='read write',
+            expires__gt=timezone.now() + TOKEN_REUSE_MIN_LIFETIME,
+            refresh_token__isnull=False, refresh_token__revoked__isnull=True,
+        )
+        .order_by('-expires')
+        .first()
+    )
+    if access_token is None:
+        return None, None
+    return access_token, access_token.refresh_token
+
 
 class VerifyTokenView(APIView):
     permission_classes = [permissions.AllowAny]  # Allow unauthenticated access to this view
@@ -48,59 +90,64 @@ class VerifyTokenView(APIView):
             return Response({"error": "Missing client_id"}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            # Use the custom token verification function with leeway
-            decoded_token = auth.verify_id_token(id_token)
+            # Use the custom token verification function, cached until the token expires
+            decoded_token = verify_firebase_token(id_token)
             
             uid = decoded_token['uid']
             email = decoded_token.get('email', None)
-            full_name = decoded_token.get('name', None)
+            full_name = decoded_token.get('name', None) or ''
             picture = decoded_token.get('picture', None)
             contact_number = decoded_token.get('phone_number', None)  # Profile picture URL
             
             name_parts = full_name.split(' ', 1)  # Split into two parts
             firstname = name_parts[0] if len(name_parts) > 0 else ''
             lastname = name_parts[1] if len(name_parts) > 1 else ''
-            
-            # Find or create the user based on UID
-            user, created = User.objects.get_or_create(
-                username=uid, defaults={'email': email, 'first_name': firstname, 'last_name': lastname}
-            )
-            if created:
-                user.set_unusable_password()
-                user.save()
-
-            # Find or create the UserProfile
-            profile, profile_created = UserProfile.objects.get_or_create(
-                user=user,
-                defaults={
-                    'photo': picture,
-                    'contact_number': contact_number
-                }
-            )
-            
-            if not profile_created:
-                profile.photo = picture
-                profile.contact_number = contact_number
-                profile.save()
 
-            # OAuth2: Generate access and refresh tokens
+            # OAuth2: Look up the application before writing anything
             application = get_application_model().objects.get(client_id=client_id)
-            
-            # Create access and refresh tokens
-            access_token = AccessToken.objects.create(
-                user=user,
-                scope='read write',
-                expires=timezone.now() + timedelta(hours=1),  # Set token expiry
-                token=generate_token(),
-                application=application
-            )
-
-            refresh_token = RefreshToken.objects.create(
-                user=user,
-                token=generate_token(),
-                application=application,
-                access_token=access_token
-            )
+
+            with transaction.atomic():
+                # Find or create the user based on UID
+                user, created = User.objects.get_or_create(
+                    username=uid, defaults={'email': email, 'first_name': firstname, 'last_name': lastname}
+                )
+                if created:
+                    user.set_unusable_password()
+                    user.save(update_fields=['password'])
+
+                # Find or create the UserProfile
+                profile, profile_created = UserProfile.objects.get_or_create(
+                    user=user,
+                    defaults={
+                        'photo': picture,
+                        'contact_number': contact_number
+                    }
+                )
+
+                # Only write the profile when the token carries new values
+                if not profile_created and (profile.photo != picture or profile.contact_number != contact_number):
+                    profile.photo = picture
+                    profile.contact_number = contact_number
+                    profile.save(update_fields=['photo', 'contact_number', 'updated_at'])
+
+                # Hand out the tokens from an earlier login while they are still good
+                access_token, refresh_token = get_reusable_tokens(user, application)
+                if access_token is None:
+                    # Create access and refresh tokens
+                    access_token = AccessToken.objects.create(
+                        user=user,
+                        scope='read write',
+                        expires=timezone.now() + timedelta(hours=1),  # Set token expiry
+                        token=generate_token(),
+                        application=application
+                    )
+
+                    refresh_token = RefreshToken.objects.create(
+                        user=user,
+                        token=generate_token(),
+                        application=application,
+                        access_token=access_token
+                    )
 
             # Prepare response data
             data = {